@@ -0,0 +1,338 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque
+from app.cache import TTLCache
+from app.config import settings
+from app.workers import service_pool
+
+
+def build_prompt(question: str) -> str:
+    """Structured prompt asking for a short, bullet-point answer"""
+    return f"""
+        You are a technical expert for StackIt Q&A platform.
+        Provide a STRUCTURED, CONCISE answer to: {question}
+
+        FORMAT REQUIREMENTS:
+        • Use bullet points for key information
+        • Keep answers SHORT and CRISP
+        • Include code examples only if essential
+        • Maximum 3-4 bullet points
+        • Each point should be 1-2 sentences max
+
+        EXAMPLE FORMAT:
+        • **Main Solution**: Brief explanation
+        • **Key Steps**: Essential actions to take
+        • **Best Practice**: Important tip
+        • **Common Pitfall**: What to avoid
+        """
+
+
+class AIProvider:
+    """Generates answer text for a prompt"""
+
+    model_name = "unknown"
+
+    async def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str):
+        """Yield the answer in chunks as they are generated"""
+        yield await self.generate(prompt)
+
+
+class GeminiProvider(AIProvider):
+    """Google Gemini through one shared model client and its async API"""
+
+    def __init__(self, model_name: str, api_key: str):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self._model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self._model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str):
+        response = await self._model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeProvider(AIProvider):
+    """Local stand-in for tests and offline development
+
+    Answers instantly (or after ``delay`` seconds) with a canned
+    bullet-point answer that echoes the question. Streaming yields it word
+    by word, spread over the same delay.
+    """
+
+    model_name = "fake"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    async def generate(self, prompt: str) -> str:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self._answer(prompt)
+
+    async def stream(self, prompt: str):
+        words = re.findall(r"\S+\s*", self._answer(prompt))
+        for word in words:
+            await asyncio.sleep(self.delay / len(words))
+            yield word
+
+    def _answer(self, prompt):
+        question = prompt.split("CONCISE answer to:", 1)[-1].split("\n", 1)[0].strip()
+        return (
+            f"• **Main Solution**: This is an offline answer to \"{question}\"\n"
+            "• **Key Steps**: Search existing questions, then ask the community\n"
+            "• **Best Practice**: Include a minimal example of the problem"
+        )
+
+
+class AIService:
+    """Bounded, time-limited access to an AIProvider
+
+    At most ``max_concurrency`` provider calls (or streams) are in flight;
+    further requests wait for a slot. Waiting and generating together must
+    finish within ``timeout`` seconds, so a slow upstream ties up neither
+    the event loop nor callers for longer than that. A stream instead must
+    produce each chunk within ``timeout`` seconds of the previous one.
+    """
+
+    def __init__(self, provider: AIProvider, max_concurrency: int, timeout: float):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.streams_cancelled = 0
+        self._first_chunk_times = deque(maxlen=256)  # seconds, recent streams
+        self._lock = threading.Lock()
+        # asyncio primitives belong to one event loop, so keep one per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._semaphores:
+                self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._semaphores[loop]
+
+    async def _generate(self, prompt):
+        semaphore = self._semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            return await self.provider.generate(prompt)
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    async def generate(self, prompt: str) -> str:
+        """Generate an answer; raises asyncio.TimeoutError past the timeout"""
+        try:
+            text = await asyncio.wait_for(self._generate(prompt), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        return text
+
+    async def stream(self, prompt: str):
+        """Yield answer chunks; raises asyncio.TimeoutError if the upstream stalls
+
+        Closing the generator early (e.g. the client went away) closes the
+        upstream stream and frees the slot.
+        """
+        started = time.perf_counter()
+        semaphore = self._semaphore()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        chunks = self.provider.stream(prompt)
+        try:
+            first = True
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                if first:
+                    self._first_chunk_times.append(time.perf_counter() - started)
+                    first = False
+                yield chunk
+            self.completed += 1
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            self.streams_cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+            await chunks.aclose()
+
+    def stats(self) -> dict:
+        first_chunk_ms = sorted(seconds * 1000 for seconds in self._first_chunk_times)
+        return {
+            "provider": self.provider.model_name,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "streams_cancelled": self.streams_cancelled,
+            "first_chunk_avg_ms": sum(first_chunk_ms) / len(first_chunk_ms) if first_chunk_ms else None,
+            "first_chunk_p95_ms": first_chunk_ms[int(len(first_chunk_ms) * 0.95)] if first_chunk_ms else None
+        }
+
+
+def answer_key(question: str, model_name: str) -> str:
+    """Cache key of a question hashed together with the model name
+
+    Case, spacing and trailing ``?!.`` are ignored; other symbols are kept
+    so that "C++", "C#" and "C" stay different questions.
+    """
+    normalized = " ".join(question.lower().split()).rstrip("?!. ")
+    return hashlib.sha256(f"{model_name}\n{normalized}".encode()).hexdigest()
+
+
+class AnswerStore:
+    """On-disk tier of the AI answer cache, in its own SQLite file"""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers "
+            "(key TEXT PRIMARY KEY, model TEXT NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - ttl,))
+
+    def get(self, key: str):
+        """Stored answer and its age in seconds, or None if missing or expired"""
+        with self._lock:
+            row = self._conn.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        age = time.time() - row[1]
+        return (row[0], age) if age < self.ttl else None
+
+    def put(self, key: str, model_name: str, answer: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, model, answer, created_at) VALUES (?, ?, ?, ?)",
+                (key, model_name, answer, time.time())
+            )
+
+
+class AnswerCache:
+    """Memory (LRU) and disk tiers of generated answers, with single-flight
+
+    Answers are keyed by answer_key() and expire ``ttl`` seconds after they
+    were generated, in both tiers. Concurrent requests for the same key
+    share one upstream call instead of each paying for it.
+    """
+
+    def __init__(self, memory: TTLCache, store: AnswerStore = None):
+        self.memory = memory
+        self.store = store
+        self._inflight = {}  # key -> task generating it
+
+    async def lookup(self, key: str):
+        """Return the cached answer and its tier (memory or disk), or (None, None)"""
+        answer = self.memory.get(key)
+        if answer is not None:
+            return answer, "memory"
+
+        if self.store is not None:
+            stored = await service_pool.run(self.store.get, key)
+            if stored is not None:
+                answer, age = stored
+                self.memory.set(key, answer, expires_at=time.monotonic() + self.memory.ttl - age)
+                return answer, "disk"
+        return None, None
+
+    async def store_answer(self, key: str, model_name: str, answer: str):
+        self.memory.set(key, answer)
+        if self.store is not None:
+            await service_pool.run(self.store.put, key, model_name, answer)
+
+    async def get_or_generate(self, key: str, model_name: str, generate):
+        """Return the answer and where it came from: memory, disk or upstream"""
+        answer, source = await self.lookup(key)
+        if answer is not None:
+            return answer, source
+
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._generate(key, model_name, generate))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # A caller giving up (timeout, disconnect) must not cancel the shared call
+        return await asyncio.shield(task), "upstream"
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def _generate(self, key, model_name, generate):
+        answer = await generate()
+        await self.store_answer(key, model_name, answer)
+        return answer
+
+
+def create_provider() -> AIProvider:
+    """Provider selected by settings.ai_provider"""
+    if settings.ai_provider == "gemini":
+        return GeminiProvider(settings.ai_model, settings.google_ai_api_key)
+    if settings.ai_provider == "fake":
+        return FakeProvider(settings.ai_fake_delay)
+    raise ValueError(f"Unknown AI provider: {settings.ai_provider}")
+
+
+ai_service = AIService(create_provider(), settings.ai_max_concurrency, settings.ai_timeout)
+
+ai_answer_cache = AnswerCache(
+    TTLCache("ai-answers", settings.ai_cache_size, settings.ai_cache_ttl),
+    AnswerStore(settings.ai_cache_path, settings.ai_cache_ttl) if settings.ai_cache_path else None
+)
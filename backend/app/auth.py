@@ -1,55 +1,74 @@
 import uuid
+import secrets
 from datetime import datetime
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from tinydb import Query
 from app.database import users_table
-from app.utils import verify_password, get_password_hash, create_access_token, verify_token
+from app.cache import TTLCache, CachedResponse, make_etag, cache_stats
+from app.serialization import response_rows, dump_json
+from app.utils import password_hasher, create_access_token, verify_token
+from app.workers import service_pool
 from app.models import UserCreate, UserLogin, UserResponse, Token
 
-import re
 from typing import List, Optional
 from app.database import questions_table
-from app.models import QuestionCreate, QuestionUpdate, QuestionResponse, QuestionListResponse
+from app.counters import view_counter
+from app.search import question_search, question_tags, question_recency, newest_keys, encode_cursor, decode_cursor
+from app.ranking import question_ranking, RANKED_SORTS
+from app.models import QuestionCreate, QuestionUpdate, QuestionResponse
 
 from app.database import answers_table
-from app.models import AnswerCreate, AnswerUpdate, AnswerResponse, AnswerListResponse
+from app.models import AnswerCreate, AnswerUpdate, AnswerResponse
 
-from app.database import votes_table
+from app.database import votes_table, db_lock, transaction
 from app.models import VoteCreate, VoteResult
 
 from app.database import tags_table
+from app.tags import tag_stats
 from app.models import TagCreate, TagResponse, TagListResponse
 
-from app.models import AdminBanUser, AdminMessage, AdminBanResponse, AdminMessageResponse, AdminReports
+from app.models import AdminBanUser, AdminMessage, AdminBanResponse, AdminMessageResponse, AdminReports, AdminReconcileVotesResponse, AdminCollectOrphansResponse, AdminCacheStatsResponse, AdminMetricsResponse, AdminImportResponse, ImportQuestion, ImportAnswer, ImportVote
 
 from app.database import notifications_table
-from app.models import NotificationResponse, NotificationListResponse
+from app.notifications import notification_broker, notification_inbox, notification_queue, send_notifications, deliver_notifications
+from app.models import NotificationResponse, NotificationStreamTicket
 
-import google.generativeai as genai
+import asyncio
+import json
 import time
+from contextlib import aclosing
 from app.config import settings
+from app.ai import ai_service, ai_answer_cache, answer_key, build_prompt
 from app.models import AIQuestionRequest, AIAnswerResponse
 
 
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Authenticated users by email, and decoded token payloads until they expire
+user_cache = TTLCache("users", settings.user_cache_size, settings.user_cache_ttl)
+token_cache = TTLCache("tokens", settings.user_cache_size, settings.access_token_expire_minutes * 60)
+
+# Single-use tickets for /notifications/stream, mapped to the user's email
+stream_tickets = TTLCache("stream-tickets", settings.user_cache_size, settings.notification_ticket_ttl)
+
+# Serialized answer lists by (question_id, sort), and question documents by id
+ANSWER_SORTS = ("newest", "oldest", "votes")
+answer_list_cache = TTLCache("answer-lists", settings.response_cache_size, settings.response_cache_ttl)
+question_cache = TTLCache("questions", settings.response_cache_size, settings.response_cache_ttl)
 
 #Users management and auth functions
 
-def register_user(user_data: UserCreate):
-    User = Query()
-    
+async def register_user(user_data: UserCreate):
     # Check if user already exists
-    existing_user = users_table.search(User.email == user_data.email)
+    existing_user = await service_pool.run(_load_user, user_data.email)
     if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
+        raise _email_taken()
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     new_user = {
         "id": str(uuid.uuid4()),
         "username": user_data.username,
@@ -60,36 +79,80 @@ def register_user(user_data: UserCreate):
         "role": "user"
     }
     
-    users_table.insert(new_user)
+    await service_pool.run(_insert_user, new_user)
     return {"message": "User registered successfully", "user_id": new_user["id"]}
 
-def authenticate_user(user_data: UserLogin):
-    User = Query()
-    user = users_table.search(User.email == user_data.email)
+def _email_taken():
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Email already registered"
+    )
+
+def _insert_user(new_user: dict):
+    # Check again: the same email may have registered while the password was hashing
+    with db_lock:
+        if _load_user(new_user["email"]):
+            raise _email_taken()
+        users_table.insert(new_user)
+
+async def authenticate_user(user_data: UserLogin):
+    user = await service_pool.run(_load_user, user_data.email)
+    
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update(user_data.password, user["password_hash"])
     
-    if not user or not verify_password(user_data.password, user[0]["password_hash"]):
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
-    user = user[0]
+    # Rehash passwords stored with an outdated bcrypt cost factor
+    if new_hash:
+        user["password_hash"] = new_hash
     access_token = create_access_token(data={"sub": user["email"]})
     user["access_token"] = access_token
-    users_table.update(user, Query().email == user["email"])
+    await service_pool.run(_store_login, user)
     return Token(
         access_token=access_token,
         token_type="bearer",
         user=UserResponse(**user)
     )
 
+def _store_login(user: dict):
+    users_table.update(user, Query().email == user["email"])
+    user_cache.invalidate(user["email"])
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await _user_from_token(credentials.credentials)
+
+async def get_stream_user(
+    ticket: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """Like get_current_user, but also accepts a ``?ticket=`` from create_stream_ticket_service
+
+    EventSource can't send headers, and the access token itself must not go
+    in the URL, where access logs and browser history would keep it.
+    """
+    if credentials is not None:
+        return await _user_from_token(credentials.credentials)
+    if ticket is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    
+    email = stream_tickets.pop(ticket)
+    if email is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired stream ticket")
+    return await _user_by_email(email)
+
+async def _user_from_token(token: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials"
     )
     
-    payload = verify_token(credentials.credentials)
+    payload = _verify_token_cached(token)
     if payload is None:
         raise credentials_exception
     
@@ -97,12 +160,37 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if email is None:
         raise credentials_exception
     
+    return await _user_by_email(email)
+
+async def _user_by_email(email: str):
+    # Only a cache miss needs the database, off the event loop
+    user = user_cache.get(email)
+    if user is None:
+        user = await service_pool.run(user_cache.load, email, lambda: _load_user(email))
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials"
+        )
+    
+    return user
+
+def _verify_token_cached(token: str):
+    """Decode a token, reusing the result until the token expires"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+    
+    payload = verify_token(token)
+    if payload is not None:
+        seconds_left = payload.get("exp", 0) - time.time()
+        token_cache.set(token, payload, expires_at=time.monotonic() + seconds_left)
+    return payload
+
+def _load_user(email: str):
     User = Query()
     user = users_table.search(User.email == email)
-    if not user:
-        raise credentials_exception
-    
-    return user[0]
+    return user[0] if user else None
 
 #Qs Functions
 
@@ -123,89 +211,171 @@ def create_question_service(question_data: QuestionCreate, current_user: dict):
         "view_count": 0
     }
     
-    questions_table.insert(new_question)
+    # Indexed under the writer lock, so tag counts apply in write order
+    with transaction():
+        questions_table.insert(new_question)
+        _index_question(new_question)
     return QuestionResponse(**new_question)
 
-def get_questions_service(page: int = 1, limit: int = 10, search: Optional[str] = None, tags: Optional[List[str]] = None):
-    """Get all questions with pagination and filtering"""
+def _index_question(question: dict, previous: Optional[dict] = None):
+    """Add a new or updated question to the question indexes and tag counts"""
+    question_cache.invalidate(question["id"])
+    question_search.add(question)
+    question_tags.add(question)
+    question_recency.add(question)
+    question_ranking.refresh(question["id"])
+    tag_stats.apply(previous["tags"] if previous else [], question["tags"])
+
+def _unindex_question(question: dict):
+    """Drop a deleted question from the question indexes, rankings, tag counts and caches"""
+    _question_changed(question["id"], answers=True)
+    question_search.remove(question["id"])
+    question_tags.remove(question["id"])
+    question_recency.remove(question["id"])
+    tag_stats.apply(question["tags"], [])
+
+def get_questions_service(page: int = 1, limit: int = 10, search: Optional[str] = None, tags: Optional[List[str]] = None, sort: str = "newest", tag_mode: str = "all", after: Optional[str] = None):
+    """Get all questions with pagination and filtering
+
+    Pages are either offset-based (``page``) or keyset-based: ``after`` is
+    the ``next_cursor`` of the previous page and takes precedence over
+    ``page``. Cursors only apply to the newest-first order.
+    
+    ``sort`` is newest (the default), relevance (with ``search``), or one of
+    the ranked orders: hot, votes, unanswered (questions without answers
+    only) and active (most recent question or answer edit first).
+    """
     Question = Query()
     
-    # Build query conditions
-    conditions = []
+    if tag_mode not in ["all", "any"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Tag mode must be 'all' or 'any'"
+        )
+    
+    # Narrow down candidates through the search and tag indexes
+    candidate_ids = None
+    scores = None
     
     if search:
-        conditions.append(
-            (Question.title.matches(f'.*{search}.*', flags=re.IGNORECASE)) |
-            (Question.description.matches(f'.*{search}.*', flags=re.IGNORECASE))
-        )
+        scores = question_search.search(search)
+        candidate_ids = set(scores)
     
     if tags:
-        for tag in tags:
-            conditions.append(Question.tags.any([tag]))
-    
-    # Execute query
-    if conditions:
-        query_result = questions_table.search(conditions[0])
-        for condition in conditions[1:]:
-            query_result = [q for q in query_result if questions_table.search(condition)]
-    else:
-        query_result = questions_table.all()
-    
-    # Sort by created_at (newest first)
-    query_result.sort(key=lambda x: x['created_at'], reverse=True)
+        tagged_ids = question_tags.match(tags, tag_mode)
+        if candidate_ids is None:
+            candidate_ids = set(tagged_ids)
+        else:
+            candidate_ids.intersection_update(tagged_ids)
     
-    # Pagination
-    total = len(query_result)
     start = (page - 1) * limit
-    end = start + limit
-    paginated_questions = query_result[start:end]
-    
-    questions = [QuestionResponse(**q) for q in paginated_questions]
-    
-    return QuestionListResponse(
-        questions=questions,
-        total=total,
-        page=page,
-        limit=limit
-    )
+    next_cursor = None
+    
+    if sort == "relevance" and scores is not None:
+        # Best BM25 match first, newest first among equal scores
+        ranked_ids = sorted(
+            candidate_ids,
+            key=lambda question_id: (scores[question_id], question_recency.key(question_id)),
+            reverse=True
+        )
+        page_ids = ranked_ids[start:start + limit]
+        total = len(candidate_ids)
+    elif sort in RANKED_SORTS:
+        if candidate_ids is None:
+            # Straight from the ranked order, only the page is read
+            page_ids = question_ranking.page(sort, start, limit)
+            total = question_ranking.count(sort)
+        else:
+            ranked_keys = sorted(
+                key for key in (question_ranking.key(sort, question_id) for question_id in candidate_ids) if key is not None
+            )
+            page_ids = [key[-1] for key in ranked_keys[start:start + limit]]
+            total = len(ranked_keys)
+    else:
+        before = None
+        if after:
+            try:
+                before = decode_cursor(after)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid cursor"
+                )
+            start = 0
+        
+        # Newest first; fetch one extra key to know whether a next page exists
+        if candidate_ids is None:
+            keys = question_recency.newest(limit + 1, start, before)
+            total = question_recency.count()
+        else:
+            candidate_keys = sorted(
+                key for key in map(question_recency.key, candidate_ids) if key is not None
+            )
+            keys = newest_keys(candidate_keys, limit + 1, start, before)
+            total = len(candidate_keys)
+        
+        if len(keys) > limit:
+            keys = keys[:limit]
+            next_cursor = encode_cursor(keys[-1])
+        page_ids = [question_id for _, question_id in keys]
+    
+    paginated_questions = [questions_table.get(Question.id == question_id) for question_id in page_ids]
+    
+    # Serialized QuestionListResponse, straight from the stored rows
+    return dump_json({
+        "questions": response_rows(QuestionResponse, [q for q in paginated_questions if q is not None]),
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "next_cursor": next_cursor
+    })
 
 def get_question_by_id_service(question_id: str):
-    """Get a specific question by ID"""
-    Question = Query()
-    question = questions_table.search(Question.id == question_id)
+    """Get a specific question by ID, with validators for conditional requests
     
-    if not question:
+    The ETag is weak: it covers everything but the view count, which
+    changes with every request.
+    """
+    cached = question_cache.get_or_load(question_id, lambda: _load_question(question_id))
+    
+    if cached is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Question not found"
         )
+    question, etag, last_modified = cached
     
-    # Increment view count
-    questions_table.update(
-        {"view_count": question[0]["view_count"] + 1},
-        Question.id == question_id
-    )
+    # Count the view in memory; it is merged into the table in batches
+    view_count = view_counter.record_view(question_id)
     
-    updated_question = questions_table.search(Question.id == question_id)[0]
-    return QuestionResponse(**updated_question)
+    body = dump_json(response_rows(QuestionResponse, [{**question, "view_count": view_count}])[0])
+    return CachedResponse(body, etag, last_modified)
+
+def _load_question(question_id: str):
+    """Question document, its weak ETag and load time, or None"""
+    Question = Query()
+    question = questions_table.get(Question.id == question_id)
+    if question is None:
+        return None
+    
+    content = dump_json(response_rows(QuestionResponse, [{**question, "view_count": 0}])[0])
+    return dict(question), make_etag(content, weak=True), time.time()
+
+def _question_changed(question_id: str, answers: bool = False):
+    """Drop cached responses of a question, and of its answer lists too"""
+    question_cache.invalidate(question_id)
+    if answers:
+        _answers_changed(question_id)
+
+def _answers_changed(question_id: str):
+    """Drop cached answer lists of a question and re-rank it"""
+    for sort in ANSWER_SORTS:
+        answer_list_cache.invalidate((question_id, sort))
+    question_ranking.refresh(question_id)
 
 def update_question_service(question_id: str, question_data: QuestionUpdate, current_user: dict):
     """Update a question (owner only)"""
     Question = Query()
-    question = questions_table.search(Question.id == question_id)
-    
-    if not question:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Question not found"
-        )
-    
-    # Check if user is the owner
-    if question[0]["author_id"] != current_user["id"]:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to update this question"
-        )
     
     # Update fields
     update_data = {}
@@ -218,30 +388,55 @@ def update_question_service(question_id: str, question_data: QuestionUpdate, cur
     
     update_data["updated_at"] = datetime.utcnow().isoformat()
     
-    questions_table.update(update_data, Question.id == question_id)
-    
-    updated_question = questions_table.search(Question.id == question_id)[0]
+    # Read, write and re-index under the writer lock, so the tag counts move
+    # from exactly the version this update replaces
+    with transaction():
+        question = questions_table.search(Question.id == question_id)
+        
+        if not question:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Question not found"
+            )
+        
+        # Check if user is the owner
+        if question[0]["author_id"] != current_user["id"]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to update this question"
+            )
+        
+        questions_table.update(update_data, Question.id == question_id)
+        
+        updated_question = questions_table.search(Question.id == question_id)[0]
+        _index_question(updated_question, previous=question[0])
     return QuestionResponse(**updated_question)
 
 def delete_question_service(question_id: str, current_user: dict):
     """Delete a question (owner or admin only)"""
     Question = Query()
-    question = questions_table.search(Question.id == question_id)
-    
-    if not question:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Question not found"
-        )
-    
-    # Check if user is the owner or admin
-    if question[0]["author_id"] != current_user["id"] and current_user.get("role") != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to delete this question"
-        )
     
-    questions_table.remove(Question.id == question_id)
+    # Look up, check, delete and unindex under the writer lock, so a
+    # concurrent delete of the same question finds it gone
+    with transaction():
+        question = questions_table.search(Question.id == question_id)
+        
+        if not question:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Question not found"
+            )
+        
+        # Check if user is the owner or admin
+        if question[0]["author_id"] != current_user["id"] and current_user.get("role") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to delete this question"
+            )
+        
+        # Its answers, their votes and notifications go in the same write
+        _delete_with_dependents(questions=question)
+        _unindex_question(question[0])
     return {"message": "Question deleted successfully"}
 
 #Ans Functions
@@ -249,14 +444,6 @@ def delete_question_service(question_id: str, current_user: dict):
 def create_answer_service(question_id: str, answer_data: AnswerCreate, current_user: dict):
     """Create a new answer for a question"""
     Question = Query()
-    question = questions_table.search(Question.id == question_id)
-    
-    if not question:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Question not found"
-        )
-    
     new_answer = {
         "id": str(uuid.uuid4()),
         "content": answer_data.content,
@@ -266,16 +453,25 @@ def create_answer_service(question_id: str, answer_data: AnswerCreate, current_u
         "created_at": datetime.utcnow().isoformat(),
         "updated_at": datetime.utcnow().isoformat(),
         "vote_count": 0,
+        "upvotes": 0,
+        "downvotes": 0,
         "is_accepted": False
     }
     
-    answers_table.insert(new_answer)
-    
-    # Update question's answer count
-    questions_table.update(
-        {"answer_count": question[0]["answer_count"] + 1},
-        Question.id == question_id
-    )
+    # Check the question, insert the answer and bump the question's answer
+    # count under the writer lock, so a concurrent delete can't orphan it
+    with transaction():
+        question = questions_table.search(Question.id == question_id)
+        
+        if not question:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Question not found"
+            )
+        
+        answers_table.insert(new_answer)
+        questions_table.update(_shift_answer_count(1), Question.id == question_id)
+    _question_changed(question_id, answers=True)
     
     # create notif for question owner
     question_owner_id = question[0]["author_id"]
@@ -290,6 +486,15 @@ def create_answer_service(question_id: str, answer_data: AnswerCreate, current_u
     return AnswerResponse(**new_answer)
 
 
+def get_cached_answers_service(question_id: str, sort: str = "newest"):
+    """Serialized answer list of a question, built by get_answers_service on a cache miss"""
+    key = (question_id, sort if sort in ANSWER_SORTS else "newest")
+    return answer_list_cache.get_or_load(key, lambda: _load_answers(*key))
+
+def _load_answers(question_id: str, sort: str):
+    body = get_answers_service(question_id, sort)
+    return CachedResponse(body, make_etag(body))
+
 def get_answers_service(question_id: str, sort: str = "newest"):
     """Get all answers for a question"""
     Question = Query()
@@ -317,13 +522,12 @@ def get_answers_service(question_id: str, sort: str = "newest"):
     other_answers = [a for a in answers if not a.get('is_accepted', False)]
     sorted_answers = accepted_answers + other_answers
     
-    answer_responses = [AnswerResponse(**answer) for answer in sorted_answers]
-    
-    return AnswerListResponse(
-        answers=answer_responses,
-        total=len(answers),
-        question_id=question_id
-    )
+    # Serialized AnswerListResponse, straight from the stored rows
+    return dump_json({
+        "answers": response_rows(AnswerResponse, sorted_answers),
+        "total": len(answers),
+        "question_id": question_id
+    })
 
 def update_answer_service(answer_id: str, answer_data: AnswerUpdate, current_user: dict):
     """Update an answer (author only)"""
@@ -351,6 +555,7 @@ def update_answer_service(answer_id: str, answer_data: AnswerUpdate, current_use
     update_data["updated_at"] = datetime.utcnow().isoformat()
     
     answers_table.update(update_data, Answer.id == answer_id)
+    _answers_changed(answer[0]["question_id"])
     
     updated_answer = answers_table.search(Answer.id == answer_id)[0]
     return AnswerResponse(**updated_answer)
@@ -373,21 +578,80 @@ def delete_answer_service(answer_id: str, current_user: dict):
             detail="Not authorized to delete this answer"
         )
     
-    question_id = answer[0]["question_id"]
-    
-    # Remove the answer
-    answers_table.remove(Answer.id == answer_id)
+    _delete_answer(answer[0])
     
-    # Update question's answer count
+    return {"message": "Answer deleted successfully"}
+
+def _delete_answer(answer: dict):
+    """Delete an answer with its votes and notifications, and update its question"""
     Question = Query()
-    question = questions_table.search(Question.id == question_id)
-    if question:
-        questions_table.update(
-            {"answer_count": max(0, question[0]["answer_count"] - 1)},
-            Question.id == question_id
+    with transaction():
+        _delete_with_dependents(answers=[answer])
+        questions_table.update(_answer_removed(answer["id"]), Question.id == answer["question_id"])
+    _question_changed(answer["question_id"], answers=True)
+
+def _shift_answer_count(delta: int):
+    """Table update adding ``delta`` to a question's answer count"""
+    def shift(question):
+        question["answer_count"] = max(0, question.get("answer_count", 0) + delta)
+    return shift
+
+def _answer_removed(answer_id: str):
+    """Table update for a question losing one of its answers"""
+    def remove(question):
+        question["answer_count"] = max(0, question.get("answer_count", 0) - 1)
+        if question.get("accepted_answer_id") == answer_id:
+            question["accepted_answer_id"] = None
+    return remove
+
+def _current(table, query, document: dict, name: str):
+    """Stored version of a document, 404 if it is gone"""
+    current = table.get(query.id == document["id"])
+    if current is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{name} not found"
         )
+    return current
+
+def _delete_with_dependents(questions: list = (), answers: list = ()):
+    """Delete questions and answers along with everything that refers to them
     
-    return {"message": "Answer deleted successfully"}
+    Questions take their answers with them, answers their votes and the
+    notifications about them. Everything is removed in one transaction, so
+    it reaches storage as a single write. Answer counts of surviving
+    questions are left to the caller.
+    
+    The given documents are looked up again inside the transaction; if one
+    was deleted meanwhile, this raises 404 and deletes nothing.
+    """
+    Question = Query()
+    Answer = Query()
+    Vote = Query()
+    Notification = Query()
+    
+    with transaction():
+        questions = [_current(questions_table, Question, question, "Question") for question in questions]
+        answers = [_current(answers_table, Answer, answer, "Answer") for answer in answers]
+        for question in questions:
+            answers.extend(answers_table.search(Answer.question_id == question["id"]))
+        
+        vote_ids = []
+        notifications = []
+        for answer in answers:
+            vote_ids.extend(vote.doc_id for vote in votes_table.search(Vote.answer_id == answer["id"]))
+            notifications.extend(notifications_table.search(Notification.related_id == answer["id"]))
+        
+        if questions:
+            questions_table.remove(doc_ids=[question.doc_id for question in questions])
+        if answers:
+            answers_table.remove(doc_ids=[answer.doc_id for answer in answers])
+        if vote_ids:
+            votes_table.remove(doc_ids=vote_ids)
+        if notifications:
+            notifications_table.remove(doc_ids=[notification.doc_id for notification in notifications])
+            for user_id in {notification["user_id"] for notification in notifications}:
+                notification_inbox.forget(user_id)
 
 def accept_answer_service(answer_id: str, current_user: dict):
     """Mark answer as accepted (question owner only)"""
@@ -418,23 +682,25 @@ def accept_answer_service(answer_id: str, current_user: dict):
             detail="Only question owner can accept answers"
         )
     
-    # Unaccept any previously accepted answers for this question
-    answers_table.update(
-        {"is_accepted": False},
-        Answer.question_id == question_id
-    )
-    
-    # Accept this answer
-    answers_table.update(
-        {"is_accepted": True},
-        Answer.id == answer_id
-    )
-    
-    # Update question with accepted answer ID
-    questions_table.update(
-        {"accepted_answer_id": answer_id},
-        Question.id == question_id
-    )
+    with transaction():
+        # Unaccept any previously accepted answers for this question
+        answers_table.update(
+            {"is_accepted": False},
+            (Answer.question_id == question_id) & (Answer.is_accepted == True)
+        )
+        
+        # Accept this answer
+        answers_table.update(
+            {"is_accepted": True},
+            Answer.id == answer_id
+        )
+        
+        # Update question with accepted answer ID
+        questions_table.update(
+            {"accepted_answer_id": answer_id},
+            Question.id == question_id
+        )
+    _question_changed(question_id, answers=True)
     
     updated_answer = answers_table.search(Answer.id == answer_id)[0]
     return AnswerResponse(**updated_answer)
@@ -443,67 +709,97 @@ def accept_answer_service(answer_id: str, current_user: dict):
 #Voting Functions
 
 
-def vote_answer_service(answer_id: str, vote_data: VoteCreate, current_user: dict):
-    """Upvote or downvote an answer"""
-    # Check if answer exists
-    Answer = Query()
-    answer = answers_table.search(Answer.id == answer_id)
-    
-    if not answer:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Answer not found"
-        )
-    
-    # Validate vote type
-    if vote_data.vote_type not in ["upvote", "downvote"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Vote type must be 'upvote' or 'downvote'"
-        )
+def _vote_tallies(answer: dict):
+    """Current (upvotes, downvotes) of an answer"""
+    if "upvotes" in answer and "downvotes" in answer:
+        return answer["upvotes"], answer["downvotes"]
     
-    # Check if user already voted on this answer
+    # Answers created before tallies were kept: count their votes once
     Vote = Query()
-    existing_vote = votes_table.search(
-        (Vote.answer_id == answer_id) & (Vote.user_id == current_user["id"])
-    )
+    votes = votes_table.search(Vote.answer_id == answer["id"])
+    upvotes = len([v for v in votes if v["vote_type"] == "upvote"])
+    return upvotes, len(votes) - upvotes
+
+def _apply_vote_delta(answer: dict, removed: Optional[str] = None, added: Optional[str] = None):
+    """Shift an answer's tallies by one removed and/or one added vote"""
+    upvotes, downvotes = answer["upvotes"], answer["downvotes"]
+    if removed == "upvote":
+        upvotes -= 1
+    elif removed == "downvote":
+        downvotes -= 1
+    if added == "upvote":
+        upvotes += 1
+    elif added == "downvote":
+        downvotes += 1
     
-    if existing_vote:
-        # Update existing vote if different
-        if existing_vote[0]["vote_type"] != vote_data.vote_type:
+    answers_table.update(
+        {"upvotes": upvotes, "downvotes": downvotes, "vote_count": upvotes - downvotes},
+        doc_ids=[answer.doc_id]
+    )
+    return upvotes - downvotes
+
+def vote_answer_service(answer_id: str, vote_data: VoteCreate, current_user: dict):
+    """Upvote or downvote an answer"""
+    # Check, change and recount in one transaction so concurrent votes
+    # can't interleave and lose updates, and the vote and tallies agree
+    with transaction():
+        # Check if answer exists
+        Answer = Query()
+        answer = answers_table.search(Answer.id == answer_id)
+        
+        if not answer:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Answer not found"
+            )
+        
+        # Validate vote type
+        if vote_data.vote_type not in ["upvote", "downvote"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Vote type must be 'upvote' or 'downvote'"
+            )
+        
+        answer = answer[0]
+        answer["upvotes"], answer["downvotes"] = _vote_tallies(answer)
+        
+        # Check if user already voted on this answer
+        Vote = Query()
+        existing_vote = votes_table.search(
+            (Vote.answer_id == answer_id) & (Vote.user_id == current_user["id"])
+        )
+        
+        if existing_vote:
+            # Update existing vote if different
+            if existing_vote[0]["vote_type"] == vote_data.vote_type:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"You have already {vote_data.vote_type}d this answer"
+                )
+            
             votes_table.update(
                 {
                     "vote_type": vote_data.vote_type,
                     "created_at": datetime.utcnow().isoformat()
                 },
-                (Vote.answer_id == answer_id) & (Vote.user_id == current_user["id"])
+                doc_ids=[existing_vote[0].doc_id]
             )
+            removed_vote = existing_vote[0]["vote_type"]
         else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"You have already {vote_data.vote_type}d this answer"
-            )
-    else:
-        # Create new vote
-        new_vote = {
-            "id": str(uuid.uuid4()),
-            "answer_id": answer_id,
-            "user_id": current_user["id"],
-            "vote_type": vote_data.vote_type,
-            "created_at": datetime.utcnow().isoformat()
-        }
-        votes_table.insert(new_vote)
-    
-    # Calculate new vote count
-    upvotes = len(votes_table.search((Vote.answer_id == answer_id) & (Vote.vote_type == "upvote")))
-    downvotes = len(votes_table.search((Vote.answer_id == answer_id) & (Vote.vote_type == "downvote")))
-    new_vote_count = upvotes - downvotes
-    
-    # Update answer's vote count
-    answers_table.update(
-        {"vote_count": new_vote_count},
-        Answer.id == answer_id
-    )
+            # Create new vote
+            new_vote = {
+                "id": str(uuid.uuid4()),
+                "answer_id": answer_id,
+                "user_id": current_user["id"],
+                "vote_type": vote_data.vote_type,
+                "created_at": datetime.utcnow().isoformat()
+            }
+            votes_table.insert(new_vote)
+            removed_vote = None
+        
+        # Shift the tallies instead of recounting every vote
+        new_vote_count = _apply_vote_delta(answer, removed=removed_vote, added=vote_data.vote_type)
+    _answers_changed(answer["question_id"])
     
     return VoteResult(
         message=f"Answer {vote_data.vote_type}d successfully",
@@ -514,43 +810,37 @@ def vote_answer_service(answer_id: str, vote_data: VoteCreate, current_user: dic
 
 def remove_vote_service(answer_id: str, current_user: dict):
     """Remove user's vote from an answer"""
-    # Check if answer exists
-    Answer = Query()
-    answer = answers_table.search(Answer.id == answer_id)
-    
-    if not answer:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Answer not found"
-        )
-    
-    # Check if user has voted on this answer
-    Vote = Query()
-    existing_vote = votes_table.search(
-        (Vote.answer_id == answer_id) & (Vote.user_id == current_user["id"])
-    )
-    
-    if not existing_vote:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You haven't voted on this answer"
+    with transaction():
+        # Check if answer exists
+        Answer = Query()
+        answer = answers_table.search(Answer.id == answer_id)
+        
+        if not answer:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Answer not found"
+            )
+        
+        answer = answer[0]
+        answer["upvotes"], answer["downvotes"] = _vote_tallies(answer)
+        
+        # Check if user has voted on this answer
+        Vote = Query()
+        existing_vote = votes_table.search(
+            (Vote.answer_id == answer_id) & (Vote.user_id == current_user["id"])
         )
-    
-    # Remove the vote
-    votes_table.remove(
-        (Vote.answer_id == answer_id) & (Vote.user_id == current_user["id"])
-    )
-    
-    # Recalculate vote count
-    upvotes = len(votes_table.search((Vote.answer_id == answer_id) & (Vote.vote_type == "upvote")))
-    downvotes = len(votes_table.search((Vote.answer_id == answer_id) & (Vote.vote_type == "downvote")))
-    new_vote_count = upvotes - downvotes
-    
-    # Update answer's vote count
-    answers_table.update(
-        {"vote_count": new_vote_count},
-        Answer.id == answer_id
-    )
+        
+        if not existing_vote:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="You haven't voted on this answer"
+            )
+        
+        # Remove the vote
+        votes_table.remove(doc_ids=[existing_vote[0].doc_id])
+        
+        new_vote_count = _apply_vote_delta(answer, removed=existing_vote[0]["vote_type"])
+    _answers_changed(answer["question_id"])
     
     return VoteResult(
         message="Vote removed successfully",
@@ -562,48 +852,19 @@ def remove_vote_service(answer_id: str, current_user: dict):
 
 
 # tag service functions
-def get_tags_service(search: Optional[str] = None, limit: int = 100):
+def get_tags_service(search: Optional[str] = None, limit: int = 100, fuzzy: bool = False):
     """Get available tags for multi-select dropdown"""
-    # Get all unique tags from existing questions
-    all_questions = questions_table.all()
-    tag_usage = {}
-    
-    # Count tag usage across all questions
-    for question in all_questions:
-        for tag in question.get('tags', []):
-            tag_lower = tag.lower()
-            if tag_lower in tag_usage:
-                tag_usage[tag_lower]['count'] += 1
-                # Keep the most recent capitalization
-                tag_usage[tag_lower]['name'] = tag
-            else:
-                tag_usage[tag_lower] = {
-                    'name': tag,
-                    'count': 1
-                }
-    
-    # Build simple tag responses
-    tag_responses = []
-    for tag_key, usage_data in tag_usage.items():
-        # Apply search filter if provided
-        if search and search.lower() not in usage_data['name'].lower():
-            continue
-            
-        tag_response = TagResponse(
-            name=usage_data['name'],
-            usage_count=usage_data['count']
-        )
-        tag_responses.append(tag_response)
+    # Served from the materialized tag counts, most popular first
+    tags, total = tag_stats.top(limit, prefix=search.strip() if search else None, fuzzy=fuzzy)
     
-    # Sort by usage count (most popular first) for better UX
-    tag_responses.sort(key=lambda x: x.usage_count, reverse=True)
-    
-    # Apply limit
-    limited_tags = tag_responses[:limit]
+    tag_responses = [
+        TagResponse(name=tag["display_name"], usage_count=tag["usage_count"])
+        for tag in tags
+    ]
     
     return TagListResponse(
-        tags=limited_tags,
-        total=len(tag_responses)
+        tags=tag_responses,
+        total=total
     )
 
 def create_tag_service(tag_data: TagCreate, current_user: dict):
@@ -626,7 +887,7 @@ def create_tag_service(tag_data: TagCreate, current_user: dict):
     # Return the tag (it will be created when used in a question)
     return TagResponse(
         name=tag_name,
-        usage_count=0
+        usage_count=tag_stats.usage(tag_name)
     )
 
 
@@ -648,6 +909,7 @@ def admin_ban_user_service(ban_data: AdminBanUser, current_user: dict):
         {"is_banned": True, "ban_reason": ban_data.reason},
         User.id == ban_data.user_id
     )
+    user_cache.invalidate(user_to_ban[0]["email"])
     
     return AdminBanResponse(
         message="User banned successfully",
@@ -660,13 +922,29 @@ def admin_send_message_service(message_data: AdminMessage, current_user: dict):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Count active users
+    # Notify every active user
     active_users = [u for u in users_table.all() if not u.get("is_banned", False)]
+    created_at = datetime.utcnow().isoformat()
+    notifications = [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": user["id"],
+            "type": message_data.type,
+            "message": message_data.message,
+            "is_read": False,
+            "created_at": created_at,
+            "related_id": None
+        }
+        for user in active_users
+    ]
+    
+    # Delivered in the background in bulk inserts; a full queue answers 503
+    if not notification_queue.submit(notifications):
+        deliver_notifications(notifications)
     
-    # Simple implementation - just return success
     return AdminMessageResponse(
-        message="Platform message sent successfully",
-        sent_to_users=len(active_users)
+        message="Platform message queued for delivery",
+        sent_to_users=len(notifications)
     )
 
 def admin_reject_content_service(content_type: str, content_id: str, current_user: dict):
@@ -676,19 +954,272 @@ def admin_reject_content_service(content_type: str, content_id: str, current_use
     
     Query_obj = Query()
     
-    if content_type == "question":
-        content = questions_table.search(Query_obj.id == content_id)
-        if content:
-            questions_table.remove(Query_obj.id == content_id)
-            return {"message": "Question rejected and removed"}
-    elif content_type == "answer":
-        content = answers_table.search(Query_obj.id == content_id)
-        if content:
-            answers_table.remove(Query_obj.id == content_id)
-            return {"message": "Answer rejected and removed"}
+    # Under the writer lock, like the owner deletes
+    with transaction():
+        if content_type == "question":
+            content = questions_table.search(Query_obj.id == content_id)
+            if content:
+                _delete_with_dependents(questions=content)
+                _unindex_question(content[0])
+                return {"message": "Question rejected and removed"}
+        elif content_type == "answer":
+            content = answers_table.search(Query_obj.id == content_id)
+            if content:
+                _delete_answer(content[0])
+                return {"message": "Answer rejected and removed"}
     
     raise HTTPException(status_code=404, detail="Content not found")
 
+def admin_reconcile_votes_service(current_user: dict):
+    """Rebuild every answer's vote tallies from the votes table - Admin only"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    with db_lock:
+        # One pass over the votes...
+        tallies = {}
+        votes = votes_table.all()
+        for vote in votes:
+            tally = tallies.setdefault(vote["answer_id"], {"upvote": 0, "downvote": 0})
+            if vote["vote_type"] in tally:
+                tally[vote["vote_type"]] += 1
+        
+        # ...and one write for all answers
+        def reset_tallies(answer):
+            tally = tallies.get(answer["id"], {"upvote": 0, "downvote": 0})
+            answer["upvotes"] = tally["upvote"]
+            answer["downvotes"] = tally["downvote"]
+            answer["vote_count"] = tally["upvote"] - tally["downvote"]
+        
+        answer_ids = [answer.doc_id for answer in answers_table.all()]
+        answers_table.update(reset_tallies, doc_ids=answer_ids)
+    answer_list_cache.clear()
+    question_ranking.reload()
+    
+    return AdminReconcileVotesResponse(
+        message="Vote tallies rebuilt",
+        answers_updated=len(answer_ids),
+        votes_counted=len(votes)
+    )
+
+def admin_collect_orphans_service(current_user: dict):
+    """Purge answers, votes and notifications left behind by deleted content - Admin only
+    
+    Deletes used to remove only the question or answer itself, so older
+    databases can hold answers of missing questions, votes on missing
+    answers and notifications about them. Everything found is removed in
+    one write.
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    with transaction():
+        question_ids = {question["id"] for question in questions_table.all()}
+        answer_ids = set()
+        orphan_answers = []
+        for answer in answers_table.all():
+            if answer["question_id"] in question_ids:
+                answer_ids.add(answer["id"])
+            else:
+                orphan_answers.append(answer)
+        
+        # Only answer notifications refer to content (admin messages have no related_id)
+        orphan_votes = [vote.doc_id for vote in votes_table.all() if vote["answer_id"] not in answer_ids]
+        orphan_notifications = [
+            notification for notification in notifications_table.all()
+            if notification.get("related_id") is not None and notification["related_id"] not in answer_ids
+        ]
+        
+        if orphan_answers:
+            answers_table.remove(doc_ids=[answer.doc_id for answer in orphan_answers])
+        if orphan_votes:
+            votes_table.remove(doc_ids=orphan_votes)
+        if orphan_notifications:
+            notifications_table.remove(doc_ids=[notification.doc_id for notification in orphan_notifications])
+            for user_id in {notification["user_id"] for notification in orphan_notifications}:
+                notification_inbox.forget(user_id)
+    
+    return AdminCollectOrphansResponse(
+        message="Orphaned content removed",
+        answers_removed=len(orphan_answers),
+        votes_removed=len(orphan_votes),
+        notifications_removed=len(orphan_notifications)
+    )
+
+def admin_import_service(content: bytes, current_user: dict):
+    """Import questions, answers and votes from JSONL - Admin only
+    
+    Each line is an object with ``"type"`` set to ``question``, ``answer`` or
+    ``vote``. Answers and votes may refer to existing content or to content
+    earlier in the file. Everything is written in one transaction, so an
+    invalid line imports nothing.
+    """
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    def invalid(line_number, detail):
+        return HTTPException(status_code=400, detail=f"Line {line_number}: {detail}")
+    
+    # Parse every line before touching the database
+    records = []
+    now = datetime.utcnow().isoformat()
+    for line_number, line in enumerate(content.decode("utf-8", errors="replace").splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            model = {"question": ImportQuestion, "answer": ImportAnswer, "vote": ImportVote}.get(item.get("type"))
+            if model is None:
+                raise invalid(line_number, "type must be 'question', 'answer' or 'vote'")
+            record = model(**item)
+        except (ValueError, TypeError, AttributeError) as e:
+            raise invalid(line_number, str(e))
+        
+        created_at = record.created_at.isoformat() if record.created_at else now
+        if item["type"] == "question":
+            doc = {
+                "id": record.id or str(uuid.uuid4()),
+                "title": record.title,
+                "description": record.description,
+                "tags": record.tags,
+                "author_id": record.author_id or current_user["id"],
+                "author_username": record.author_username or current_user["username"],
+                "created_at": created_at,
+                "updated_at": created_at,
+                "vote_count": 0,
+                "answer_count": 0,
+                "accepted_answer_id": None,
+                "view_count": 0
+            }
+        elif item["type"] == "answer":
+            doc = {
+                "id": record.id or str(uuid.uuid4()),
+                "content": record.content,
+                "question_id": record.question_id,
+                "author_id": record.author_id or current_user["id"],
+                "author_username": record.author_username or current_user["username"],
+                "created_at": created_at,
+                "updated_at": created_at,
+                "vote_count": 0,
+                "upvotes": 0,
+                "downvotes": 0,
+                "is_accepted": False
+            }
+        else:
+            if record.vote_type not in ["upvote", "downvote"]:
+                raise invalid(line_number, "vote_type must be 'upvote' or 'downvote'")
+            doc = {
+                "id": record.id or str(uuid.uuid4()),
+                "answer_id": record.answer_id,
+                "user_id": record.user_id,
+                "vote_type": record.vote_type,
+                "created_at": created_at
+            }
+        records.append((line_number, item["type"], doc))
+    
+    Question = Query()
+    Answer = Query()
+    Vote = Query()
+    questions, answers, votes = {}, {}, []
+    existing_questions, existing_answers = {}, {}  # id -> stored document
+    answer_deltas, vote_deltas = {}, {}
+    voters = set()
+    
+    # Check references against the database and the file, then write it all at once
+    with transaction():
+        for line_number, kind, doc in records:
+            if kind == "question":
+                if doc["id"] in questions or questions_table.get(Question.id == doc["id"]):
+                    raise invalid(line_number, f"question {doc['id']} already exists")
+                questions[doc["id"]] = doc
+            
+            elif kind == "answer":
+                question_id = doc["question_id"]
+                if question_id not in questions and question_id not in existing_questions:
+                    question = questions_table.get(Question.id == question_id)
+                    if not question:
+                        raise invalid(line_number, f"question {question_id} not found")
+                    existing_questions[question_id] = question
+                if doc["id"] in answers or answers_table.get(Answer.id == doc["id"]):
+                    raise invalid(line_number, f"answer {doc['id']} already exists")
+                answers[doc["id"]] = doc
+                answer_deltas[question_id] = answer_deltas.get(question_id, 0) + 1
+            
+            else:
+                answer_id = doc["answer_id"]
+                if answer_id not in answers and answer_id not in existing_answers:
+                    answer = answers_table.get(Answer.id == answer_id)
+                    if not answer:
+                        raise invalid(line_number, f"answer {answer_id} not found")
+                    existing_answers[answer_id] = answer
+                voter = (answer_id, doc["user_id"])
+                if voter in voters or votes_table.get((Vote.answer_id == answer_id) & (Vote.user_id == doc["user_id"])):
+                    raise invalid(line_number, f"user {doc['user_id']} already voted on answer {answer_id}")
+                voters.add(voter)
+                votes.append(doc)
+                delta = vote_deltas.setdefault(answer_id, {"upvote": 0, "downvote": 0})
+                delta[doc["vote_type"]] += 1
+        
+        # Counts of imported content are set before it is inserted...
+        for question_id, delta in answer_deltas.items():
+            if question_id in questions:
+                questions[question_id]["answer_count"] = delta
+        for answer_id, delta in vote_deltas.items():
+            if answer_id in answers:
+                answer = answers[answer_id]
+                answer["upvotes"], answer["downvotes"] = delta["upvote"], delta["downvote"]
+                answer["vote_count"] = delta["upvote"] - delta["downvote"]
+        
+        # ...and counts of existing content shifted before the new votes exist
+        for question_id, question in existing_questions.items():
+            questions_table.update(_shift_answer_count(answer_deltas[question_id]), doc_ids=[question.doc_id])
+        for answer_id, answer in existing_answers.items():
+            upvotes, downvotes = _vote_tallies(answer)
+            upvotes += vote_deltas[answer_id]["upvote"]
+            downvotes += vote_deltas[answer_id]["downvote"]
+            answers_table.update(
+                {"upvotes": upvotes, "downvotes": downvotes, "vote_count": upvotes - downvotes},
+                doc_ids=[answer.doc_id]
+            )
+        
+        questions_table.insert_multiple(questions.values())
+        answers_table.insert_multiple(answers.values())
+        votes_table.insert_multiple(votes)
+    
+    for question in questions.values():
+        _index_question(question)
+    for question_id in existing_questions:
+        _question_changed(question_id, answers=True)
+    for answer in existing_answers.values():
+        _answers_changed(answer["question_id"])
+    
+    return AdminImportResponse(
+        message="Import completed",
+        questions=len(questions),
+        answers=len(answers),
+        votes=len(votes)
+    )
+
+def admin_cache_stats_service(current_user: dict):
+    """Get hit/miss counters of the in-process caches - Admin only"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return AdminCacheStatsResponse(caches=cache_stats())
+
+def admin_metrics_service(current_user: dict):
+    """Get load metrics of the background worker pools - Admin only"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return AdminMetricsResponse(
+        password_hashing=password_hasher.stats(),
+        services=service_pool.stats(),
+        ai=ai_service.stats(),
+        notifications=notification_broker.stats(),
+        notification_queue=notification_queue.stats()
+    )
+
 def admin_get_reports_service(current_user: dict):
     """Get basic platform reports - Admin only"""
     if current_user.get("role") != "admin":
@@ -707,34 +1238,40 @@ def admin_get_reports_service(current_user: dict):
 #notification service functions
 def get_user_notifications_service(current_user: dict, limit: int = 10):
     """Get user notifications for dropdown"""
-    Notification = Query()
-    
-    # Get user's notifications (recent first)
-    user_notifications = notifications_table.search(Notification.user_id == current_user["id"])
-    user_notifications.sort(key=lambda x: x['created_at'], reverse=True)
-    
-    # Limit for dropdown display
-    recent_notifications = user_notifications[:limit]
-    
-    # Count unread
-    unread_count = len([n for n in user_notifications if not n.get("is_read", False)])
-    
-    # Convert to response
-    notification_responses = [NotificationResponse(**n) for n in recent_notifications]
-    
-    return NotificationListResponse(
-        notifications=notification_responses,
-        unread_count=unread_count
-    )
+    # Served from the user's in-memory inbox (recent first, unread count)
+    recent = notification_inbox.recent(current_user["id"], limit)
+    if recent is not None:
+        recent_notifications, unread_count = recent
+    else:
+        # Older than the inbox keeps, read them from the table
+        Notification = Query()
+        user_notifications = notifications_table.search(Notification.user_id == current_user["id"])
+        user_notifications.sort(key=lambda x: x['created_at'], reverse=True)
+        recent_notifications = user_notifications[:limit]
+        unread_count = len([n for n in user_notifications if not n.get("is_read", False)])
+    
+    # Serialized NotificationListResponse, straight from the stored rows
+    return dump_json({
+        "notifications": response_rows(NotificationResponse, recent_notifications),
+        "unread_count": unread_count
+    })
 
 def mark_notification_read_service(notification_id: str, current_user: dict):
     """Mark notification as read"""
     Notification = Query()
     
-    notifications_table.update(
-        {"is_read": True},
-        (Notification.id == notification_id) & (Notification.user_id == current_user["id"])
-    )
+    with db_lock:
+        # Check if it is the user's and still unread, so the count stays right
+        notification = notifications_table.get(
+            (Notification.id == notification_id) & (Notification.user_id == current_user["id"])
+        )
+        if notification and not notification.get("is_read", False):
+            notifications_table.update({"is_read": True}, doc_ids=[notification.doc_id])
+            notification_inbox.mark_read(current_user["id"], notification_id)
+    
+    # Keep the user's other open tabs in sync
+    if notification:
+        notification_broker.publish(current_user["id"], "read", {"id": notification_id})
     
     return {"message": "Notification marked as read"}
 
@@ -742,10 +1279,13 @@ def mark_all_notifications_read_service(current_user: dict):
     """Mark all notifications as read"""
     Notification = Query()
     
-    notifications_table.update(
-        {"is_read": True},
-        Notification.user_id == current_user["id"]
-    )
+    with db_lock:
+        notifications_table.update(
+            {"is_read": True},
+            Notification.user_id == current_user["id"]
+        )
+        notification_inbox.mark_all_read(current_user["id"])
+    notification_broker.publish(current_user["id"], "read_all", {})
     
     return {"message": "All notifications marked as read"}
 
@@ -761,11 +1301,38 @@ def create_notification_helper(user_id: str, notification_type: str, message: st
         "related_id": related_id
     }
     
-    notifications_table.insert(new_notification)
+    # Stored and pushed to the user's open streams in the background
+    send_notifications([new_notification])
+
+def create_stream_ticket_service(current_user: dict):
+    """Short-lived, single-use ticket that opens one notification stream"""
+    ticket = secrets.token_urlsafe(32)
+    stream_tickets.set(ticket, current_user["email"])
+    return NotificationStreamTicket(ticket=ticket, expires_in=settings.notification_ticket_ttl)
 
+async def stream_notifications_service(current_user: dict, request: Request):
+    """Push the user's notifications as Server-Sent Events
+    
+    Starts with an ``event: snapshot`` holding what GET /notifications
+    returns, then sends ``notification``, ``read`` and ``read_all`` events as
+    they happen. ``resync`` means events were dropped and the client should
+    refetch. A comment line is sent when idle to keep the connection open.
+    """
+    # Subscribe before reading the snapshot so nothing falls in between
+    subscription = notification_broker.subscribe(current_user["id"])
+    try:
+        snapshot = await service_pool.run(get_user_notifications_service, current_user)
+        yield _sse_event(json.loads(snapshot), "snapshot")
+        
+        while not await request.is_disconnected():
+            message = await subscription.get(settings.notification_keepalive)
+            if message is None:
+                yield ": keepalive\n\n"
+            else:
+                yield _sse_event(message["data"], message["event"])
+    finally:
+        notification_broker.unsubscribe(subscription)
 
-# Configure Google AI
-genai.configure(api_key=settings.google_ai_api_key)
 
 # # Add this AI service function
 # def get_ai_answer_service(question_request: AIQuestionRequest):
@@ -808,45 +1375,86 @@ genai.configure(api_key=settings.google_ai_api_key)
     
 
 
-def get_ai_answer_service(question_request: AIQuestionRequest):
-    """Get AI-generated answer using Gemini 2.5 Flash Lite Preview"""
+async def get_ai_answer_service(question_request: AIQuestionRequest):
+    """Get AI-generated answer from the configured provider"""
     try:
         start_time = time.time()
+        model_name = ai_service.provider.model_name
         
-        # Use Gemini 2.5 Flash Lite Preview model
-        model = genai.GenerativeModel('gemini-2.5-flash-lite-preview-06-17')
-        
-        # Enhanced structured prompt for crisp, bullet-point answers
-        prompt = f"""
-        You are a technical expert for StackIt Q&A platform. 
-        Provide a STRUCTURED, CONCISE answer to: {question_request.question}
-        
-        FORMAT REQUIREMENTS:
-        • Use bullet points for key information
-        • Keep answers SHORT and CRISP
-        • Include code examples only if essential
-        • Maximum 3-4 bullet points
-        • Each point should be 1-2 sentences max
-        
-        EXAMPLE FORMAT:
-        • **Main Solution**: Brief explanation
-        • **Key Steps**: Essential actions to take
-        • **Best Practice**: Important tip
-        • **Common Pitfall**: What to avoid
-        """
-        
-        response = model.generate_content(prompt)
+        # Repeated questions are answered from the cache
+        answer, source = await ai_answer_cache.get_or_generate(
+            answer_key(question_request.question, model_name),
+            model_name,
+            lambda: ai_service.generate(build_prompt(question_request.question))
+        )
         end_time = time.time()
         
         return AIAnswerResponse(
-            answer=response.text,
-            model_used="gemini-2.5-flash-lite-preview-06-17",
-            response_time=round(end_time - start_time, 2)
+            answer=answer,
+            model_used=model_name,
+            response_time=round(end_time - start_time, 2),
+            cached=source != "upstream"
         )
         
+    except asyncio.TimeoutError:
+        return AIAnswerResponse(
+            answer="• **Error**: AI service took too long to answer\n• **Solution**: Try again in a moment or ask the community",
+            model_used="error-handler",
+            response_time=0.0
+        )
     except Exception as e:
         return AIAnswerResponse(
             answer="• **Error**: AI service temporarily unavailable\n• **Solution**: Try again in a moment or ask the community",
             model_used="error-handler",
             response_time=0.0
-        )
\ No newline at end of file
+        )
+
+def _sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def stream_ai_answer_service(question: str, request: Request):
+    """Stream an AI-generated answer as Server-Sent Events
+    
+    Emits ``data: {"text": ...}`` chunks, then an ``event: done`` with
+    timings, or an ``event: error``. Stops generating when the client
+    disconnects.
+    """
+    start_time = time.time()
+    model_name = ai_service.provider.model_name
+    key = answer_key(question, model_name)
+    
+    # Cached answers arrive as a single chunk
+    answer, source = await ai_answer_cache.lookup(key)
+    if answer is not None:
+        yield _sse_event({"text": answer})
+        elapsed = round(time.time() - start_time, 2)
+        yield _sse_event({"model_used": model_name, "response_time": elapsed, "first_chunk_time": elapsed, "cached": True}, "done")
+        return
+    
+    parts = []
+    first_chunk_time = None
+    try:
+        async with aclosing(ai_service.stream(build_prompt(question))) as chunks:
+            async for chunk in chunks:
+                if await request.is_disconnected():
+                    return
+                if first_chunk_time is None:
+                    first_chunk_time = round(time.time() - start_time, 2)
+                parts.append(chunk)
+                yield _sse_event({"text": chunk})
+    except asyncio.TimeoutError:
+        yield _sse_event({"detail": "AI service took too long to answer"}, "error")
+        return
+    except Exception:
+        yield _sse_event({"detail": "AI service temporarily unavailable"}, "error")
+        return
+    
+    await ai_answer_cache.store_answer(key, model_name, "".join(parts))
+    yield _sse_event({
+        "model_used": model_name,
+        "response_time": round(time.time() - start_time, 2),
+        "first_chunk_time": first_chunk_time,
+        "cached": False
+    }, "done")
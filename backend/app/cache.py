@@ -0,0 +1,162 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+
+_caches = {}
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after ``ttl`` seconds
+
+    Hits and misses are counted so cache_stats() can report them. Entries
+    may carry their own expiry time (e.g. a token's ``exp``) when that comes
+    earlier than the cache-wide ttl.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._invalidations = 0
+        _caches[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def pop(self, key, default=None):
+        """Remove an entry and return its value, or ``default`` if it's missing or expired"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, expires_at: float = None):
+        """Store a value; ``expires_at`` is a time.monotonic() deadline"""
+        with self._lock:
+            self._put(key, value, expires_at)
+
+    def _put(self, key, value, expires_at=None):
+        if self.maxsize <= 0:
+            return
+        deadline = time.monotonic() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+
+        self._entries[key] = (deadline, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value, or call ``loader()`` and cache a non-None result"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        return self.load(key, loader)
+
+    def load(self, key, loader):
+        """Call ``loader()`` and cache its result unless it is None
+
+        A result loaded while the key was being invalidated is returned but
+        not cached, so a stale read can't outlive the invalidation.
+        """
+        with self._lock:
+            invalidations = self._invalidations
+        value = loader()
+        if value is not None:
+            with self._lock:
+                if invalidations == self._invalidations:
+                    self._put(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+def cache_stats():
+    """Stats of every cache created in this process"""
+    return [cache.stats() for cache in _caches.values()]
+
+
+class CachedResponse:
+    """A serialized JSON response body with its ETag and Last-Modified
+
+    response() answers a request whose If-None-Match (or, without one,
+    If-Modified-Since) still matches with an empty 304 instead of the body.
+    """
+
+    def __init__(self, body: bytes, etag: str, last_modified: float = None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = int(last_modified if last_modified is not None else time.time())
+
+    def not_modified(self, request: Request) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or _strip_weak(self.etag) in map(_strip_weak, tags)
+
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def response(self, request: Request) -> Response:
+        headers = {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            # Clients may keep the body but must revalidate it each time
+            "Cache-Control": "no-cache"
+        }
+        if self.not_modified(request):
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+def make_etag(content: bytes, weak: bool = False) -> str:
+    digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+def _strip_weak(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
@@ -2,11 +2,50 @@ from pydantic_settings import BaseSettings
 import os
 
 class Settings(BaseSettings):
+    database_backend: str = "tinydb"  # tinydb, sqlite
     database_path: str = "data/stackit.json"
+    sqlite_database_path: str = "data/stackit.db"
+    database_write_behind: bool = True
+    database_flush_interval: float = 1.0  # seconds
+    database_flush_writes: int = 500
+    vote_store_path: str = ""  # votes file of the tinydb backend, empty puts it next to database_path
+    view_count_flush_interval: float = 5.0  # seconds
+    user_cache_size: int = 1024
+    user_cache_ttl: float = 60.0  # seconds
+    response_cache_size: int = 2048  # cached question and answer list responses
+    response_cache_ttl: float = 300.0  # seconds
+    hot_rank_gravity: float = 1.5  # how fast hot scores decay with question age
+    hot_rank_interval: float = 300.0  # seconds between hot score recomputes, 0 disables decay
     secret_key: str = "seckey_seckey"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    bcrypt_rounds: int = 12  # cost factor, each step doubles hashing time
+    password_hash_workers: int = 4
+    password_hash_max_queue: int = 64
+    service_workers: int = 8  # 0 runs services on the event loop
+    service_max_queue: int = 256
     google_ai_api_key: str = "your-google-ai-key"
+    ai_provider: str = "gemini"  # gemini, fake
+    ai_model: str = "gemini-2.5-flash-lite-preview-06-17"
+    ai_max_concurrency: int = 4
+    ai_timeout: float = 30.0  # seconds
+    ai_fake_delay: float = 0.0  # seconds
+    ai_cache_size: int = 512
+    ai_cache_ttl: float = 86400.0  # seconds
+    ai_cache_path: str = "data/ai_answers.db"  # empty keeps answers in memory only
+    notification_broker: str = "memory"  # memory
+    notification_queue_size: int = 100  # events buffered per open stream
+    notification_keepalive: float = 15.0  # seconds
+    notification_ticket_ttl: float = 30.0  # seconds a /notifications/stream ticket stays usable
+    notification_recent_size: int = 50  # recent notifications kept in memory per user
+    notification_retention_days: float = 30.0  # read notifications older than this are pruned
+    notification_retention_interval: float = 3600.0  # seconds, 0 disables pruning
+    notification_archive_path: str = ""  # JSON lines file for pruned notifications, empty discards them
+    notification_delivery_workers: int = 2  # 0 delivers notifications inline
+    notification_batch_size: int = 1000  # notifications per bulk insert
+    notification_max_pending: int = 200000
+    notification_delivery_retries: int = 3
+    notification_retry_delay: float = 0.5  # seconds, doubled on each retry
     
     class Config:
         env_file = ".env"
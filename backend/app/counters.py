@@ -0,0 +1,66 @@
+import atexit
+import threading
+from tinydb import Query
+from app.config import settings
+from app.database import questions_table
+from app.tasks import PeriodicTask
+
+
+class ViewCounter:
+    """Buffer question view increments in memory and merge them in batches
+
+    Page views only bump an in-memory counter. Every ``flush_interval``
+    seconds the pending counts are added to ``view_count`` in a single table
+    update, whose read-modify-write runs under the database writer lock, so
+    concurrent views are never lost.
+    """
+
+    def __init__(self, table, flush_interval: float):
+        self.table = table
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._flusher = PeriodicTask("view-count-flush", flush_interval, self.flush)
+        self._flusher.start()
+
+    def record_view(self, question_id: str) -> int:
+        """Count one view and return the question's up-to-date view count"""
+        with self._lock:
+            self._pending[question_id] = self._pending.get(question_id, 0) + 1
+            # Read under the lock so a concurrent flush can't be counted twice
+            question = self.table.get(Query().id == question_id)
+            stored = question.get("view_count", 0) if question else 0
+            return stored + self._pending[question_id]
+
+    def on_flush(self, listener):
+        """Call ``listener`` with the ids of the questions merged by each flush"""
+        self._listeners.append(listener)
+
+    def flush(self):
+        """Merge all pending view counts into the table in one update"""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+
+            Question = Query()
+            doc_ids = []
+            for question_id in pending:
+                question = self.table.get(Question.id == question_id)
+                if question:  # deleted questions just drop their views
+                    doc_ids.append(question.doc_id)
+
+            def merge_views(doc):
+                doc["view_count"] = doc.get("view_count", 0) + pending[doc["id"]]
+
+            if doc_ids:
+                self.table.update(merge_views, doc_ids=doc_ids)
+
+        # Outside the lock, so listeners may read the table or record views
+        for listener in self._listeners:
+            listener(list(pending))
+
+
+view_counter = ViewCounter(questions_table, settings.view_count_flush_interval)
+
+atexit.register(view_counter.flush)
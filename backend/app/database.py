@@ -1,20 +1,730 @@
 from tinydb import TinyDB, Query
+from tinydb.table import Table
+from tinydb.storages import Storage
+from tinydb.middlewares import Middleware
+from collections.abc import MutableMapping
+from contextlib import contextmanager
 from app.config import settings
+from app.storage import open_sqlite_database, query_equalities, write_file_atomic
+from app.tasks import PeriodicTask
+from app.votes import VoteStore, VoteTable
+import atexit
+import copy
+import json
 import os
+import threading
 
-# Ensure data directory exists
-os.makedirs(os.path.dirname(settings.database_path), exist_ok=True)
+# Fields each table is looked up by. Tuples are composite indexes; the
+# SQLite backend stores every listed field as an indexed column.
+TABLE_INDEXES = {
+    "users": ["id", "email"],
+    "questions": ["id"],
+    "answers": ["id", "question_id"],
+    "votes": ["id", ("answer_id", "user_id")],
+    "tags": ["name"],
+    "notifications": ["id", ("user_id", "created_at"), "related_id"],
+}
 
-db = TinyDB(settings.database_path)
+
+class ReadWriteLock:
+    """Reentrant single-writer lock that lets many readers in at once
+
+    ``with lock:`` takes the exclusive writer side; ``with lock.read():``
+    the shared reader side. A writer may also read (and write again), and
+    reads nest freely. A thread holding only the reader side must not try
+    to write, which would wait on itself; that raises instead. Waiting
+    writers hold off new readers, so a stream of reads can't starve them.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._writer = None
+        self._write_depth = 0
+        self._readers = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def acquire(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                return True
+            if getattr(self._local, "reads", 0):
+                raise RuntimeError("Cannot take the write lock while holding the read lock")
+
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+            return True
+
+    def release(self):
+        with self._cond:
+            if self._writer != threading.get_ident():
+                raise RuntimeError("Cannot release a write lock held by another thread")
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def is_writer(self) -> bool:
+        """Whether the current thread holds the writer side"""
+        return self._writer == threading.get_ident()
+
+    @contextmanager
+    def read(self):
+        local = self._local
+        nested = self.is_writer() or getattr(local, "reads", 0)
+        if not nested:
+            with self._cond:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+
+        local.reads = getattr(local, "reads", 0) + 1
+        try:
+            yield
+        finally:
+            local.reads -= 1
+            if not nested:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+
+# Single-writer lock shared by every database mutation and the disk flusher.
+# Services also hold it around read-check-write sequences that must be atomic.
+# Table reads take its shared side, so they run concurrently with each other
+# but never see a write half-applied.
+db_lock = ReadWriteLock()
+
+
+# Companions are stores kept in files of their own next to the JSON file
+# (the vote store). They report writes with companion_changed(), and the
+# storage writes their snapshot() before its own file, in the same flush.
+# A crash in between can then leave votes whose tallies are missing, which
+# reconciling repairs, but never tallies whose votes are missing.
+
+class AtomicJSONStorage(Storage):
+    """JSON file storage that replaces the file atomically on every write"""
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__()
+        self.path = path
+        self.kwargs = kwargs
+        self.companions = []
+
+    def attach(self, companion):
+        self.companions.append(companion)
+
+    def companion_changed(self, count: int):
+        self._write_companions()
+
+    def _write_companions(self):
+        for companion in self.companions:
+            content = companion.snapshot()
+            if content is not None:
+                companion.write_snapshot(content)
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        return json.loads(content) if content.strip() else None
+
+    def write(self, data):
+        self._write_companions()
+        self.write_text(json.dumps(data, **self.kwargs))
+
+    def write_text(self, content: str):
+        write_file_atomic(self.path, content.encode())
+
+
+class WriteBehindMiddleware(Middleware):
+    """Keep the whole database in memory and write it to disk in batches
+
+    Writes only mark the cached document dirty. It is flushed to the
+    underlying storage after ``flush_writes`` writes, every
+    ``flush_interval`` seconds by a background thread, and on close().
+    Writes to companions count too, and are flushed along with it.
+    """
+
+    def __init__(self, storage_cls, flush_interval: float = 1.0, flush_writes: int = 500):
+        super().__init__(storage_cls)
+        self.flush_interval = flush_interval
+        self.flush_writes = flush_writes
+        self.cache = None
+        self.companions = []
+        self._load_lock = threading.Lock()
+        self._pending_writes = 0  # to the cache and to companions
+        self._cache_dirty = False
+        self._flush_lock = threading.Lock()
+        self._flusher = PeriodicTask("tinydb-flush", flush_interval, self.flush)
+
+    def __call__(self, *args, **kwargs):
+        super().__call__(*args, **kwargs)
+        self._flusher.start()
+        return self
+
+    def read(self):
+        # Readers come here under the shared side of db_lock, so the first
+        # load is guarded by its own lock
+        if self.cache is None:
+            with self._load_lock:
+                if self.cache is None:
+                    self.cache = self.storage.read()
+        return self.cache
+
+    def attach(self, companion):
+        self.companions.append(companion)
+
+    def write(self, data):
+        with db_lock:
+            self.cache = data
+            self._cache_dirty = True
+            self._written_changes(1)
+
+    def companion_changed(self, count: int):
+        with db_lock:
+            self._written_changes(count)
+
+    def _written_changes(self, count):
+        self._pending_writes += count
+        if self._pending_writes >= self.flush_writes:
+            self.flush()
+
+    def flush(self):
+        """Write the cached document and companions to disk if they changed"""
+        # Snapshot everything under the writer lock, but do the disk I/O
+        # outside it. _flush_lock is taken before db_lock is released, so
+        # flushes write in snapshot order; it is never held while waiting
+        # for db_lock.
+        with db_lock:
+            if not self._pending_writes:
+                return
+            content = json.dumps(self.cache) if self._cache_dirty else None
+            snapshots = [(companion, companion.snapshot()) for companion in self.companions]
+            self._pending_writes = 0
+            self._cache_dirty = False
+            self._flush_lock.acquire()
+
+        try:
+            for companion, snapshot in snapshots:
+                if snapshot is not None:
+                    companion.write_snapshot(snapshot)
+            if content is not None:
+                self.storage.write_text(content)
+        finally:
+            self._flush_lock.release()
+
+    def close(self):
+        self._flusher.stop()
+        self.flush()
+        self.storage.close()
+
+
+class TransactionMiddleware(Middleware):
+    """Defer writes made inside a transaction to one write at commit
+
+    Between begin() and commit() the written tables stay in memory and
+    reads are served from them. Tables record the original version of
+    every document they change in ``journal`` (table name -> {doc_id:
+    document or MISSING}), so rollback() can put them back. Tables kept
+    outside this storage (the vote store) append functions to ``undo``
+    instead, which rollback() calls newest first; their writes reach the
+    storage at commit, with the tables'.
+    """
+
+    MISSING = object()
+
+    def __init__(self, storage_cls):
+        super().__init__(storage_cls)
+        self.journal = None
+        self.undo = None
+        self._pending = None
+        self._companion_writes = 0
+
+    def attach(self, companion):
+        """Have the storage write ``companion`` along with the database"""
+        self.storage.attach(companion)
+
+    def companion_changed(self, count: int):
+        if self.journal is not None:
+            self._companion_writes += count
+        else:
+            self.storage.companion_changed(count)
+
+    def read(self):
+        if self._pending is not None:
+            return self._pending
+        return self.storage.read()
+
+    def write(self, data):
+        if self.journal is not None:
+            self._pending = data
+        else:
+            self.storage.write(data)
+
+    def begin(self):
+        self.journal = {}
+        self.undo = []
+
+    def commit(self):
+        pending, companion_writes = self._pending, self._companion_writes
+        self.journal = None
+        self.undo = None
+        self._pending = None
+        self._companion_writes = 0
+        if pending is not None:
+            self.storage.write(pending)
+        if companion_writes:
+            self.storage.companion_changed(companion_writes)
+
+    def rollback(self):
+        """Undo the transaction's changes; returns the names of the tables it touched"""
+        journal = self.journal
+        tables = self._pending if self._pending is not None else self.storage.read() or {}
+        for name, originals in journal.items():
+            raw_table = tables.get(name, {})
+            for doc_id, original in originals.items():
+                if original is self.MISSING:
+                    raw_table.pop(doc_id, None)
+                else:
+                    raw_table[doc_id] = original
+        for undo in reversed(self.undo):
+            undo()
+        self.journal = None
+        self.undo = None
+        self._pending = None
+        self._companion_writes = 0
+        return list(journal)
+
+
+class _DocIdTable(MutableMapping):
+    """View of a stored table dict keyed by doc_id instead of its string form"""
+
+    def __init__(self, raw_table, document_id_class):
+        self._raw = raw_table
+        self._document_id_class = document_id_class
+
+    def __getitem__(self, doc_id):
+        return self._raw[str(doc_id)]
+
+    def __setitem__(self, doc_id, doc):
+        self._raw[str(doc_id)] = doc
+
+    def __delitem__(self, doc_id):
+        del self._raw[str(doc_id)]
+
+    def __contains__(self, doc_id):
+        return str(doc_id) in self._raw
+
+    def __iter__(self):
+        return (self._document_id_class(doc_id) for doc_id in list(self._raw))
+
+    def __len__(self):
+        return len(self._raw)
+
+
+class _JournaledDocIdTable(_DocIdTable):
+    """_DocIdTable that saves a copy of each document before it first changes"""
+
+    def __init__(self, raw_table, document_id_class, originals):
+        super().__init__(raw_table, document_id_class)
+        self._originals = originals
+
+    def _save(self, doc_id):
+        key = str(doc_id)
+        if key not in self._originals:
+            if key in self._raw:
+                self._originals[key] = copy.deepcopy(self._raw[key])
+            else:
+                self._originals[key] = TransactionMiddleware.MISSING
+
+    def __getitem__(self, doc_id):
+        # Updates change the returned document in place
+        self._save(doc_id)
+        return super().__getitem__(doc_id)
+
+    def __setitem__(self, doc_id, doc):
+        self._save(doc_id)
+        super().__setitem__(doc_id, doc)
+
+    def __delitem__(self, doc_id):
+        self._save(doc_id)
+        super().__delitem__(doc_id)
+
+
+class IndexedTable(Table):
+    """TinyDB table with in-memory hash indexes over its TABLE_INDEXES fields
+
+    Every index maps a tuple of field values to the doc_ids holding them.
+    Composite indexes are also kept for each of their leading prefixes, so
+    ``answer_id`` alone is served by the (``answer_id``, ``user_id``) index.
+    Queries pinning an indexed field to a value only look at matching
+    documents; every write keeps the indexes up to date.
+
+    Reads hold the shared side of db_lock and writes the exclusive side.
+    TinyDB's per-table query cache is bypassed: it isn't safe to share
+    between concurrent readers, and the indexes make it redundant.
+    """
+
+    def __init__(self, storage, name, **kwargs):
+        super().__init__(storage, name, **kwargs)
+
+        self._index_fields = []
+        for index in TABLE_INDEXES.get(name, ["id"]):
+            fields = index if isinstance(index, tuple) else (index,)
+            for size in range(1, len(fields) + 1):
+                if fields[:size] not in self._index_fields:
+                    self._index_fields.append(fields[:size])
+
+        self._indexes = None
+        self._build_lock = threading.Lock()
+
+    def _ensure_indexes(self):
+        # Concurrent readers may race to build the indexes on first use
+        if self._indexes is None:
+            with self._build_lock:
+                if self._indexes is None:
+                    indexes = {fields: {} for fields in self._index_fields}
+                    for doc_id, doc in self._read_table().items():
+                        self._index_document(self.document_id_class(doc_id), doc, indexes)
+                    self._indexes = indexes
+        return self._indexes
+
+    @staticmethod
+    def _index_key(fields, doc):
+        key = tuple(doc.get(field) for field in fields)
+        if None in key:
+            return None
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _index_document(self, doc_id, doc, indexes=None):
+        for fields, index in (indexes or self._indexes).items():
+            key = self._index_key(fields, doc)
+            if key is not None:
+                index.setdefault(key, set()).add(doc_id)
+
+    def _unindex_document(self, doc_id, doc):
+        for fields, index in self._indexes.items():
+            key = self._index_key(fields, doc)
+            if key is not None and key in index:
+                index[key].discard(doc_id)
+                if not index[key]:
+                    del index[key]
+
+    def _candidate_ids(self, cond):
+        """Doc ids that may match ``cond``, or None if no index applies"""
+        equalities = query_equalities(cond)
+        if not equalities:
+            return None
+
+        indexes = self._ensure_indexes()
+        usable = [fields for fields in indexes if all(field in equalities for field in fields)]
+        if not usable:
+            return None
+
+        # The index pinning the most fields gives the smallest candidate set
+        fields = max(usable, key=len)
+        key = tuple(equalities[field] for field in fields)
+        return sorted(indexes[fields].get(key, ()))
+
+    def _scan(self, cond):
+        return [
+            self.document_class(doc, self.document_id_class(doc_id))
+            for doc_id, doc in self._read_table().items()
+            if cond(doc)
+        ]
+
+    def _matching_ids(self, cond):
+        candidates = self._candidate_ids(cond)
+        if candidates is None:
+            return [doc.doc_id for doc in self._scan(cond)]
+
+        table = self._read_table()
+        return [
+            doc_id for doc_id in candidates
+            if str(doc_id) in table and cond(table[str(doc_id)])
+        ]
+
+    def search(self, cond):
+        with db_lock.read():
+            candidates = self._candidate_ids(cond)
+            if candidates is None:
+                return self._scan(cond)
+
+            table = self._read_table()
+            docs = []
+            for doc_id in candidates:
+                doc = table.get(str(doc_id))
+                if doc is not None and cond(doc):
+                    docs.append(self.document_class(doc, doc_id))
+            return docs
+
+    def get(self, cond=None, doc_id=None, doc_ids=None):
+        with db_lock.read():
+            if cond is not None and doc_id is None and doc_ids is None:
+                if self._candidate_ids(cond) is not None:
+                    docs = self.search(cond)
+                    return docs[0] if docs else None
+            return super().get(cond, doc_id, doc_ids)
+
+    def __iter__(self):
+        with db_lock.read():
+            docs = [
+                self.document_class(doc, self.document_id_class(doc_id))
+                for doc_id, doc in self._read_table().items()
+            ]
+        return iter(docs)
+
+    def insert(self, document):
+        with db_lock:
+            self._ensure_indexes()
+            doc_id = super().insert(document)
+            self._index_document(doc_id, document)
+            return doc_id
+
+    def insert_multiple(self, documents):
+        with db_lock:
+            self._ensure_indexes()
+            documents = list(documents)
+            doc_ids = super().insert_multiple(documents)
+            for doc_id, document in zip(doc_ids, documents):
+                self._index_document(doc_id, document)
+            return doc_ids
+
+    def update(self, fields, cond=None, doc_ids=None):
+        with db_lock:
+            return self._update(fields, cond, doc_ids)
+
+    def _update(self, fields, cond, doc_ids):
+        self._ensure_indexes()
+        if doc_ids is not None:
+            doc_ids = list(doc_ids)
+        elif cond is not None:
+            doc_ids = self._matching_ids(cond)
+        else:
+            doc_ids = [self.document_id_class(doc_id) for doc_id in self._read_table()]
+
+        table = self._read_table()
+        for doc_id in doc_ids:
+            if str(doc_id) in table:
+                self._unindex_document(doc_id, table[str(doc_id)])
+
+        try:
+            updated_ids = super().update(fields, doc_ids=doc_ids)
+        except Exception:
+            self._indexes = None
+            raise
+
+        table = self._read_table()
+        for doc_id in updated_ids:
+            self._index_document(doc_id, table[str(doc_id)])
+        return updated_ids
+
+    def update_multiple(self, updates):
+        with db_lock:
+            updated_ids = super().update_multiple(updates)
+            self._indexes = None
+            return updated_ids
+
+    def remove(self, cond=None, doc_ids=None):
+        with db_lock:
+            return self._remove(cond, doc_ids)
+
+    def _remove(self, cond, doc_ids):
+        self._ensure_indexes()
+        if doc_ids is not None:
+            doc_ids = list(doc_ids)
+        elif cond is not None:
+            doc_ids = self._matching_ids(cond)
+        else:
+            raise RuntimeError('Use truncate() to remove all documents')
+
+        table = self._read_table()
+        for doc_id in doc_ids:
+            if str(doc_id) in table:
+                self._unindex_document(doc_id, table[str(doc_id)])
+
+        return super().remove(doc_ids=doc_ids)
+
+    def truncate(self):
+        with db_lock:
+            super().truncate()
+            self._indexes = None
+
+    def _update_table(self, updater):
+        # TinyDB's version copies the whole table twice to convert doc_id
+        # keys; with the database cached in memory that copy would dominate
+        # every write, so the updater works on the stored dict in place
+        with db_lock:
+            tables = self._storage.read() or {}
+            raw_table = tables.setdefault(self.name, {})
+            journal = getattr(self._storage, "journal", None)
+            if journal is None:
+                updater(_DocIdTable(raw_table, self.document_id_class))
+            else:
+                originals = journal.setdefault(self.name, {})
+                updater(_JournaledDocIdTable(raw_table, self.document_id_class, originals))
+            self._storage.write(tables)
+            self.clear_cache()
+
+
+class IndexedTinyDB(TinyDB):
+    table_class = IndexedTable
+
+    @contextmanager
+    def transaction(self):
+        """Apply the enclosed writes as one storage write, or none of them
+
+        Holds the writer lock throughout. If the block raises, every change
+        it made is undone. A transaction opened inside another one joins it.
+        """
+        with db_lock:
+            storage = self.storage
+            if storage.journal is not None:
+                yield
+                return
+
+            storage.begin()
+            try:
+                yield
+            except BaseException:
+                for name in storage.rollback():
+                    if name in self._tables:
+                        # Rebuilt from the restored documents on next use
+                        self._tables[name]._indexes = None
+                        self._tables[name].clear_cache()
+                raise
+            storage.commit()
+
+
+def vote_store_path():
+    """File the TinyDB backend keeps votes in"""
+    return settings.vote_store_path or os.path.splitext(settings.database_path)[0] + "-votes.bin"
+
+def open_database():
+    """Open the storage backend selected by settings.database_backend"""
+    if settings.database_backend == "tinydb":
+        os.makedirs(os.path.dirname(settings.database_path), exist_ok=True)
+        if settings.database_write_behind:
+            storage = WriteBehindMiddleware(
+                AtomicJSONStorage,
+                flush_interval=settings.database_flush_interval,
+                flush_writes=settings.database_flush_writes
+            )
+        else:
+            storage = AtomicJSONStorage
+        return IndexedTinyDB(settings.database_path, storage=TransactionMiddleware(storage))
+
+    if settings.database_backend == "sqlite":
+        os.makedirs(os.path.dirname(settings.sqlite_database_path), exist_ok=True)
+        # The first start on SQLite imports an existing TinyDB file, and the
+        # votes that TinyDB keeps in a file of their own
+        is_new = not os.path.exists(settings.sqlite_database_path)
+        database = open_sqlite_database(
+            settings.sqlite_database_path,
+            TABLE_INDEXES,
+            migrate_from=settings.database_path,
+            lock=db_lock
+        )
+        if is_new and os.path.exists(vote_store_path()):
+            database.table('votes').insert_multiple(VoteStore.read(vote_store_path()).documents())
+        return database
+
+    raise ValueError(f"Unknown database backend: {settings.database_backend}")
+
+def lock_database(path: str):
+    """Claim the database for this process, or refuse to start
+
+    Search indexes, rankings, tag counts and caches live in process
+    memory and are only kept current by this process's own writes, so a
+    second server process on the same database would serve stale data and
+    overwrite tag counts. The lock is an exclusive flock on ``path``.lock,
+    held until the process exits (not enforced where fcntl is missing).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock_file = open(path + ".lock", "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError(
+            f"{path} is in use by another server process; run a single process (one uvicorn worker) per database"
+        )
+    return lock_file
+
+database_lock = lock_database(
+    settings.database_path if settings.database_backend == "tinydb" else settings.sqlite_database_path
+)
+db = open_database()
+
+def open_vote_table():
+    """Votes table: a compact VoteTable with TinyDB, a regular table with SQLite"""
+    if settings.database_backend != "tinydb":
+        return db.table('votes')
+
+    votes = VoteTable(vote_store_path(), db_lock, storage=db.storage)
+    # Votes still in the TinyDB file move to the vote store (which is saved
+    # first, so a crash in between only means moving them again)
+    stored_votes = db.table('votes')
+    if len(stored_votes):
+        votes.insert_multiple(stored_votes.all())
+        stored_votes.truncate()
+    return votes
 
 # Table definitions
 users_table = db.table('users')
 questions_table = db.table('questions')
 answers_table = db.table('answers')
-votes_table = db.table('votes')
+votes_table = open_vote_table()
 tags_table = db.table('tags')
 notifications_table = db.table('notifications')
 
+def transaction():
+    """Group several table writes into one atomic write
+
+        with transaction():
+            answers_table.update(...)
+            questions_table.update(...)
+
+    The writes are applied together when the block exits, or not at all if
+    it raises. The writer lock is held for the whole block.
+    """
+    return db.transaction()
+
 def init_database():
     """Initialize database with default data if needed"""
-    pass
\ No newline at end of file
+    pass
+
+def flush_database():
+    """Write any buffered changes to disk"""
+    storage = getattr(db, "storage", None)
+    if hasattr(storage, "flush"):
+        storage.flush()
+
+atexit.register(flush_database)
+
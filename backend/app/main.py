@@ -1,6 +1,11 @@
-from fastapi import FastAPI
-from app.database import init_database
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from app.database import init_database, flush_database
+from app.counters import view_counter
+from app.notifications import notification_retention, notification_queue
+from app.ranking import question_ranking_decay
 from app.routes import router
+from app.workers import WorkerPoolBusy
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(
@@ -20,9 +25,25 @@ app.add_middleware(
 )
 app.include_router(router)
 
+@app.exception_handler(WorkerPoolBusy)
+async def worker_pool_busy_handler(request: Request, exc: WorkerPoolBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please try again"}
+    )
+
 @app.on_event("startup")
 async def startup_event():
     init_database()
+    notification_retention.start()
+    question_ranking_decay.start()
+    await notification_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await notification_queue.stop()
+    view_counter.flush()
+    flush_database()
 
 @app.get("/")
 async def root():
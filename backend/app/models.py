@@ -56,6 +56,7 @@ class QuestionListResponse(BaseModel):
     total: int
     page: int
     limit: int
+    next_cursor: Optional[str] = None  # pass as ?after= to get the next page
 
 
 #answer models
@@ -131,6 +132,101 @@ class AdminMessageResponse(BaseModel):
     message: str
     sent_to_users: int
 
+class AdminReconcileVotesResponse(BaseModel):
+    message: str
+    answers_updated: int
+    votes_counted: int
+
+class AdminCollectOrphansResponse(BaseModel):
+    message: str
+    answers_removed: int
+    votes_removed: int
+    notifications_removed: int
+
+# One line of a JSONL import; ``type`` picks the model
+class ImportQuestion(QuestionCreate):
+    id: Optional[str] = None
+    author_id: Optional[str] = None
+    author_username: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class ImportAnswer(AnswerCreate):
+    id: Optional[str] = None
+    question_id: str
+    author_id: Optional[str] = None
+    author_username: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class ImportVote(BaseModel):
+    id: Optional[str] = None
+    answer_id: str
+    user_id: str
+    vote_type: str  # "upvote" or "downvote"
+    created_at: Optional[datetime] = None
+
+class AdminImportResponse(BaseModel):
+    message: str
+    questions: int
+    answers: int
+    votes: int
+
+class CacheStats(BaseModel):
+    name: str
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    hit_rate: float
+
+class AdminCacheStatsResponse(BaseModel):
+    caches: List[CacheStats]
+
+class WorkerPoolStats(BaseModel):
+    workers: int
+    max_queue: int
+    queued: int
+    running: int
+    completed: int
+    rejected: int
+    peak_queue_depth: int
+
+class AIServiceStats(BaseModel):
+    provider: str
+    max_concurrency: int
+    in_flight: int
+    waiting: int
+    completed: int
+    failed: int
+    timed_out: int
+    streams_cancelled: int
+    first_chunk_avg_ms: Optional[float] = None
+    first_chunk_p95_ms: Optional[float] = None
+
+class NotificationBrokerStats(BaseModel):
+    broker: str
+    users: int
+    streams: int
+    published: int
+    delivered: int
+    dropped: int
+
+class NotificationQueueStats(BaseModel):
+    workers: int
+    running: bool
+    pending: int
+    delivered: int
+    batches: int
+    retried: int
+    failed: int
+    rejected: int
+
+class AdminMetricsResponse(BaseModel):
+    password_hashing: WorkerPoolStats
+    services: WorkerPoolStats
+    ai: AIServiceStats
+    notifications: NotificationBrokerStats
+    notification_queue: NotificationQueueStats
+
 class AdminReports(BaseModel):
     total_users: int
     total_questions: int
@@ -140,7 +236,7 @@ class AdminReports(BaseModel):
 #notification models
 class NotificationResponse(BaseModel):
     id: str
-    type: str  # "new_answer", "answer_comment", "mention"
+    type: str  # "new_answer", "answer_comment", "mention", or an admin message type
     message: str
     is_read: bool
     created_at: datetime
@@ -150,6 +246,10 @@ class NotificationListResponse(BaseModel):
     notifications: List[NotificationResponse]
     unread_count: int
 
+class NotificationStreamTicket(BaseModel):
+    ticket: str
+    expires_in: float  # seconds
+
 
 #genai models
 class AIQuestionRequest(BaseModel):
@@ -158,4 +258,5 @@ class AIQuestionRequest(BaseModel):
 class AIAnswerResponse(BaseModel):
     answer: str
     model_used: str = "gemini-2.0-flash-exp"
-    response_time: Optional[float] = None
\ No newline at end of file
+    response_time: Optional[float] = None
+    cached: bool = False  # answered from the answer cache
\ No newline at end of file
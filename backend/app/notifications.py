@@ -0,0 +1,433 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from tinydb import Query
+from app.config import settings
+from app.database import notifications_table, db_lock
+from app.models import NotificationResponse
+from app.tasks import PeriodicTask
+from app.workers import WorkerPoolBusy, service_pool
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """One open notification stream of a user
+
+    Events are queued for the stream's event loop. A stream that falls
+    ``max_queue`` events behind has its backlog replaced by a single
+    ``resync`` event telling the client to refetch /notifications.
+    """
+
+    def __init__(self, user_id: str, max_queue: int):
+        self.user_id = user_id
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+    def deliver(self, event: dict) -> bool:
+        """Queue an event from any thread; False if the stream's loop is gone"""
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            return False
+        return True
+
+    def _put(self, event):
+        if self._queue.qsize() >= self.max_queue:
+            self.dropped += self._queue.qsize()
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            event = {"event": "resync", "data": {}}
+        self._queue.put_nowait(event)
+
+    async def get(self, timeout: float):
+        """Next event, or None if none arrived within ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class NotificationBroker:
+    """Fans notification events out to the open streams of their user
+
+    Services publish from any thread. The in-memory broker only reaches
+    streams held by this process; running several workers needs a broker
+    backed by a shared channel (e.g. Redis pub/sub) implementing the same
+    methods.
+    """
+
+    def publish(self, user_id: str, event: str, data: dict):
+        raise NotImplementedError
+
+    def subscribe(self, user_id: str) -> Subscription:
+        raise NotImplementedError
+
+    def has_subscribers(self, user_id: str) -> bool:
+        """Whether publishing to the user can reach any open stream"""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class InMemoryBroker(NotificationBroker):
+    """Per-user subscriber queues within this process"""
+
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self.published = 0
+        self.delivered = 0
+        self._dropped = 0  # by closed streams
+        self._subscribers = defaultdict(set)  # user_id -> subscriptions
+        self._lock = threading.Lock()
+
+    def publish(self, user_id: str, event: str, data: dict):
+        with self._lock:
+            self.published += 1
+            subscriptions = list(self._subscribers.get(user_id, ()))
+
+        message = {"event": event, "data": data}
+        for subscription in subscriptions:
+            if subscription.deliver(message):
+                with self._lock:
+                    self.delivered += 1
+            else:
+                self.unsubscribe(subscription)
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, self.max_queue)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def has_subscribers(self, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._subscribers
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            self._dropped += subscription.dropped
+            if not subscriptions:
+                del self._subscribers[subscription.user_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "broker": "memory",
+                "users": len(self._subscribers),
+                "streams": sum(len(subscriptions) for subscriptions in self._subscribers.values()),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self._dropped + sum(
+                    subscription.dropped
+                    for subscriptions in self._subscribers.values()
+                    for subscription in subscriptions
+                )
+            }
+
+
+def create_broker() -> NotificationBroker:
+    """Broker selected by settings.notification_broker"""
+    if settings.notification_broker == "memory":
+        return InMemoryBroker(settings.notification_queue_size)
+    raise ValueError(f"Unknown notification broker: {settings.notification_broker}")
+
+
+notification_broker = create_broker()
+
+
+class _Inbox:
+    def __init__(self, notifications, size):
+        self.unread = sum(1 for n in notifications if not n.get("is_read", False))
+        self.total = len(notifications)
+        newest = sorted(notifications, key=lambda n: n["created_at"], reverse=True)[:size]
+        self.recent = deque((dict(n) for n in newest), maxlen=size)  # newest first
+
+
+class NotificationInbox:
+    """Per-user unread counts and the ``size`` most recent notifications
+
+    A user's inbox is read from the table once, on first use, and then kept
+    current by the notification services. They call it while holding the
+    database writer lock, and loading holds the reader side, so a write can
+    never fall between loading an inbox and keeping it up to date.
+    """
+
+    def __init__(self, table, size: int):
+        self.table = table
+        self.size = size
+        self._inboxes = {}  # user_id -> _Inbox
+        self._lock = threading.Lock()
+
+    def _inbox(self, user_id):
+        with self._lock:
+            inbox = self._inboxes.get(user_id)
+        if inbox is not None:
+            return inbox
+
+        with db_lock.read():
+            notifications = self.table.search(Query().user_id == user_id)
+            with self._lock:
+                if user_id not in self._inboxes:
+                    self._inboxes[user_id] = _Inbox(notifications, self.size)
+                return self._inboxes[user_id]
+
+    def recent(self, user_id: str, limit: int):
+        """Newest ``limit`` notifications and the unread count, or None past ``size``"""
+        inbox = self._inbox(user_id)
+        with self._lock:
+            if limit > self.size and inbox.total > self.size:
+                return None
+            return [dict(n) for n in list(inbox.recent)[:limit]], inbox.unread
+
+    # The updates below must be called while holding db_lock
+
+    def add(self, notification: dict):
+        with self._lock:
+            inbox = self._inboxes.get(notification["user_id"])
+            if inbox is None:
+                return
+            inbox.recent.appendleft(dict(notification))
+            inbox.total += 1
+            if not notification.get("is_read", False):
+                inbox.unread += 1
+
+    def mark_read(self, user_id: str, notification_id: str):
+        """Record that one unread notification was read"""
+        with self._lock:
+            inbox = self._inboxes.get(user_id)
+            if inbox is None:
+                return
+            inbox.unread = max(0, inbox.unread - 1)
+            for notification in inbox.recent:
+                if notification["id"] == notification_id:
+                    notification["is_read"] = True
+
+    def mark_all_read(self, user_id: str):
+        with self._lock:
+            inbox = self._inboxes.get(user_id)
+            if inbox is None:
+                return
+            inbox.unread = 0
+            for notification in inbox.recent:
+                notification["is_read"] = True
+
+    def forget(self, user_id: str):
+        """Drop a user's inbox so it is reloaded, after bulk changes"""
+        with self._lock:
+            self._inboxes.pop(user_id, None)
+
+
+notification_inbox = NotificationInbox(notifications_table, settings.notification_recent_size)
+
+
+def deliver_notifications(notifications: list):
+    """Store notifications in one bulk insert and push them to open streams"""
+    with db_lock:
+        notifications_table.insert_multiple(notifications)
+        for notification in notifications:
+            notification_inbox.add(notification)
+
+    # Most recipients of a broadcast have no open stream; only serialize for those that do
+    for notification in notifications:
+        if not notification_broker.has_subscribers(notification["user_id"]):
+            continue
+        notification_broker.publish(
+            notification["user_id"], "notification", NotificationResponse(**notification).model_dump(mode="json")
+        )
+
+
+class NotificationQueue:
+    """Background delivery of notifications in batched bulk inserts
+
+    ``workers`` asyncio tasks take queued notifications, merge small
+    submissions into batches of about ``batch_size`` and write each with one
+    deliver_notifications() call on the service pool, retrying failed
+    batches ``retries`` times with exponential backoff. At most
+    ``max_pending`` notifications wait at once; beyond that submit() raises
+    WorkerPoolBusy. Until start() runs (and after stop()) submit() returns
+    False, and callers deliver inline instead.
+    """
+
+    def __init__(self, workers: int, batch_size: int, max_pending: int, retries: int, retry_delay: float):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.pending = 0
+        self.delivered = 0
+        self.batches = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        if self._loop is not None or self.workers <= 0:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop taking notifications and deliver what is queued, for up to ``timeout`` seconds"""
+        if self._loop is None:
+            return
+        with self._lock:
+            self._loop = None
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %d undelivered notifications", self.pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, notifications: list) -> bool:
+        """Queue notifications for delivery from any thread; False if not running
+
+        The whole list is queued or none of it.
+        """
+        with self._lock:
+            if self._loop is None:
+                return False
+            if self.pending + len(notifications) > self.max_pending:
+                self.rejected += len(notifications)
+                raise WorkerPoolBusy("notifications")
+            self.pending += len(notifications)
+            loop = self._loop
+
+        try:
+            loop.call_soon_threadsafe(self._enqueue, notifications)
+        except RuntimeError:  # the loop has closed
+            with self._lock:
+                self.pending -= len(notifications)
+            return False
+        return True
+
+    def _enqueue(self, notifications):
+        for start in range(0, len(notifications), self.batch_size):
+            self._queue.put_nowait(notifications[start:start + self.batch_size])
+
+    async def _work(self):
+        while True:
+            batch = await self._queue.get()
+            jobs = 1
+            # Merge whatever else is already waiting into the same write
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch = batch + self._queue.get_nowait()
+                jobs += 1
+            try:
+                await self._deliver(batch)
+            finally:
+                with self._lock:
+                    self.pending -= len(batch)
+                for _ in range(jobs):
+                    self._queue.task_done()
+
+    async def _deliver(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                await service_pool.run(deliver_notifications, batch)
+            except Exception:
+                if attempt == self.retries:
+                    self.failed += len(batch)
+                    logger.exception("Failed to deliver %d notifications", len(batch))
+                    return
+                self.retried += 1
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+            else:
+                self.delivered += len(batch)
+                self.batches += 1
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._loop is not None,
+                "pending": self.pending,
+                "delivered": self.delivered,
+                "batches": self.batches,
+                "retried": self.retried,
+                "failed": self.failed,
+                "rejected": self.rejected
+            }
+
+
+notification_queue = NotificationQueue(
+    settings.notification_delivery_workers,
+    settings.notification_batch_size,
+    settings.notification_max_pending,
+    settings.notification_delivery_retries,
+    settings.notification_retry_delay
+)
+
+
+def send_notifications(notifications: list) -> bool:
+    """Hand notifications to the delivery queue, or deliver them inline
+    when it isn't running or is full
+
+    Returns whether they were queued.
+    """
+    try:
+        if notification_queue.submit(notifications):
+            return True
+    except WorkerPoolBusy:
+        pass
+    deliver_notifications(notifications)
+    return False
+
+
+def prune_notifications(max_age_days: float = None, archive_path: str = None) -> int:
+    """Remove read notifications older than ``max_age_days``
+
+    Removed notifications are appended to ``archive_path`` as JSON lines
+    when it is set. Unread notifications are always kept. Returns how many
+    were removed.
+    """
+    if max_age_days is None:
+        max_age_days = settings.notification_retention_days
+    if archive_path is None:
+        archive_path = settings.notification_archive_path
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+    Notification = Query()
+    expired = (Notification.is_read == True) & (Notification.created_at < cutoff)
+
+    with db_lock:
+        old = notifications_table.search(expired)
+        if not old:
+            return 0
+        if archive_path:
+            with open(archive_path, "a") as archive:
+                for notification in old:
+                    archive.write(json.dumps(notification) + "\n")
+        notifications_table.remove(doc_ids=[notification.doc_id for notification in old])
+        for user_id in {notification["user_id"] for notification in old}:
+            notification_inbox.forget(user_id)
+
+    logger.info("Pruned %d read notifications older than %s", len(old), cutoff)
+    return len(old)
+
+
+notification_retention = PeriodicTask(
+    "notification-retention", settings.notification_retention_interval, prune_notifications
+)
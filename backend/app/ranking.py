@@ -0,0 +1,188 @@
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from tinydb import Query
+from app.config import settings
+from app.counters import view_counter
+from app.database import questions_table, answers_table
+from app.search import QuestionIndex
+from app.tasks import PeriodicTask
+
+RANKED_SORTS = ("hot", "votes", "unanswered", "active")
+
+
+def to_timestamp(value) -> float:
+    """Epoch seconds of an ISO timestamp (naive means UTC), 0 if unreadable"""
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def hot_score(signals, now: float, gravity: float) -> float:
+    """Engagement divided by a power of the question's age in hours at ``now``"""
+    points = signals.votes + 2 * signals.answers + signals.views / 10 + (3 if signals.accepted else 0)
+    age_hours = max(0.0, now - signals.created) / 3600
+    return points / (age_hours + 2) ** gravity
+
+
+class QuestionSignals:
+    """What the ranked orders need to know about one question"""
+
+    __slots__ = ("id", "created", "votes", "answers", "views", "accepted", "active")
+
+    def __init__(self, question: dict, answers: list):
+        self.id = question["id"]
+        self.created = to_timestamp(question.get("created_at"))
+        self.votes = sum(answer.get("vote_count", 0) for answer in answers)
+        self.answers = len(answers)
+        self.views = question.get("view_count", 0)
+        self.accepted = bool(question.get("accepted_answer_id"))
+        self.active = max(
+            [self.created, to_timestamp(question.get("updated_at"))]
+            + [to_timestamp(answer.get("updated_at") or answer.get("created_at")) for answer in answers]
+        )
+
+
+class RankedList:
+    """Question ids in ascending key order, and the current key of each"""
+
+    def __init__(self):
+        self._keys = []
+        self._key_by_id = {}
+
+    def set(self, question_id: str, key):
+        """Move a question to ``key``, or drop it from the list if key is None"""
+        self.remove(question_id)
+        if key is not None:
+            insort(self._keys, key)
+            self._key_by_id[question_id] = key
+
+    def remove(self, question_id: str):
+        key = self._key_by_id.pop(question_id, None)
+        if key is not None:
+            del self._keys[bisect_left(self._keys, key)]
+
+    def rebuild(self, key_by_id: dict):
+        self._key_by_id = key_by_id
+        self._keys = sorted(key_by_id.values())
+
+    def key(self, question_id: str):
+        return self._key_by_id.get(question_id)
+
+    def page(self, offset: int, limit: int):
+        return [key[-1] for key in self._keys[offset:offset + limit]]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class QuestionRanking(QuestionIndex):
+    """Questions ordered for the hot, votes, unanswered and active sorts
+
+    Each order is a RankedList whose keys sort best first, so a page is a
+    slice. refresh() re-reads one question and its answers and moves it in
+    every order; the services call it whenever answers, votes, views or the
+    accepted answer change.
+
+    Hot scores decay with age. To keep scores comparable they are all taken
+    at the same reference time, which recompute() advances to now while
+    re-scoring every question in one batch.
+    """
+
+    def __init__(self, loader, gravity: float):
+        super().__init__(loader)
+        self.gravity = gravity
+        self._now = time.time()
+        self._signals = {}  # question_id -> QuestionSignals
+        self._orders = {sort: RankedList() for sort in RANKED_SORTS}
+
+    def _keys(self, signals):
+        # Best first, then newest first, then by id so every key is unique
+        return {
+            "hot": (-hot_score(signals, self._now, self.gravity), -signals.created, signals.id),
+            "votes": (-signals.votes, -signals.created, signals.id),
+            "unanswered": (-signals.created, signals.id) if not signals.answers else None,
+            "active": (-signals.active, signals.id)
+        }
+
+    def _add(self, signals):
+        # RankedList.set replaces, so re-adding a question just moves it
+        self._signals[signals.id] = signals
+        for sort, key in self._keys(signals).items():
+            self._orders[sort].set(signals.id, key)
+
+    def _remove(self, question_id):
+        self._signals.pop(question_id, None)
+        for order in self._orders.values():
+            order.remove(question_id)
+
+    def refresh(self, question_id: str):
+        """Re-rank a question from its stored state (dropping it if deleted)"""
+        question = questions_table.get(Query().id == question_id)
+        if question is None:
+            self.remove(question_id)
+            return
+        signals = QuestionSignals(question, answers_table.search(Query().question_id == question_id))
+        self._ensure_loaded()
+        with self._lock:
+            self._add(signals)
+
+    def refresh_many(self, question_ids):
+        for question_id in question_ids:
+            self.refresh(question_id)
+
+    def reload(self):
+        """Forget everything; the orders are rebuilt from the tables on next use"""
+        with self._lock:
+            self._loaded = False
+            self._signals = {}
+            self._orders = {sort: RankedList() for sort in RANKED_SORTS}
+
+    def recompute(self):
+        """Re-score every hot question at the current time"""
+        if not self._loaded:
+            return
+        with self._lock:
+            self._now = time.time()
+            self._orders["hot"].rebuild({
+                question_id: self._keys(signals)["hot"] for question_id, signals in self._signals.items()
+            })
+
+    def page(self, sort: str, offset: int, limit: int):
+        """Ids of one page of questions in a ranked order"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._orders[sort].page(offset, limit)
+
+    def count(self, sort: str) -> int:
+        self._ensure_loaded()
+        with self._lock:
+            return len(self._orders[sort])
+
+    def key(self, sort: str, question_id: str):
+        """Sort key of a question in an order, None if it isn't in it"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._orders[sort].key(question_id)
+
+
+def load_question_signals():
+    """Signals of every question, from one pass over questions and answers"""
+    answers_by_question = {}
+    for answer in answers_table.all():
+        answers_by_question.setdefault(answer["question_id"], []).append(answer)
+    return [
+        QuestionSignals(question, answers_by_question.get(question["id"], []))
+        for question in questions_table.all()
+    ]
+
+
+question_ranking = QuestionRanking(load_question_signals, settings.hot_rank_gravity)
+
+# Views reach the table in batches; re-rank the viewed questions after each
+view_counter.on_flush(question_ranking.refresh_many)
+
+question_ranking_decay = PeriodicTask("question-ranking-decay", settings.hot_rank_interval, question_ranking.recompute)
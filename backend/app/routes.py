@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, UploadFile, File
+from fastapi.responses import StreamingResponse
+from app.serialization import JSONBytesResponse
 from app.models import UserCreate, UserLogin, Token, UserResponse
 from app.auth import register_user, authenticate_user, get_current_user
+from app.workers import service_pool
 
 from typing import List, Optional
 from app.models import QuestionCreate, QuestionUpdate, QuestionResponse, QuestionListResponse
@@ -15,7 +18,7 @@ from app.auth import (
 from app.models import AnswerCreate, AnswerUpdate, AnswerResponse, AnswerListResponse
 from app.auth import (
     create_answer_service,
-    get_answers_service,
+    get_cached_answers_service,
     update_answer_service,
     delete_answer_service,
     accept_answer_service
@@ -27,36 +30,47 @@ from app.auth import vote_answer_service, remove_vote_service
 from app.models import TagCreate, TagResponse, TagListResponse
 from app.auth import get_tags_service, create_tag_service
 
-from app.models import AdminBanUser, AdminMessage, AdminBanResponse, AdminMessageResponse, AdminReports
+from app.models import AdminBanUser, AdminMessage, AdminBanResponse, AdminMessageResponse, AdminReports, AdminImportResponse
 from app.auth import (
     admin_ban_user_service,
     admin_send_message_service,
     admin_reject_content_service,
+    admin_reconcile_votes_service,
+    admin_collect_orphans_service,
+    admin_import_service,
+    admin_cache_stats_service,
+    admin_metrics_service,
     admin_get_reports_service
 )
 
 # Add these imports for notification routes
-from app.models import NotificationResponse, NotificationListResponse
+from app.models import NotificationResponse, NotificationListResponse, NotificationStreamTicket
 from app.auth import (
+    get_stream_user,
     get_user_notifications_service,
+    stream_notifications_service,
+    create_stream_ticket_service,
     mark_notification_read_service,
     mark_all_notifications_read_service
 )
 
 from app.models import AIQuestionRequest, AIAnswerResponse
-from app.auth import get_ai_answer_service
+from app.auth import get_ai_answer_service, stream_ai_answer_service
 
 
 router = APIRouter()
 
+# Services are blocking (database and disk access), so every route awaits
+# them on service_pool instead of running them on the event loop
+
 # authentication routes
 @router.post("/auth/register")
 async def register(user: UserCreate):
-    return register_user(user)
+    return await register_user(user)
 
 @router.post("/auth/login", response_model=Token)
 async def login(user: UserLogin):
-    return authenticate_user(user)
+    return await authenticate_user(user)
 
 @router.post("/auth/logout")
 async def logout():
@@ -74,24 +88,29 @@ async def create_question(
     current_user: dict = Depends(get_current_user)
 ):
     """Create a new question (title, description, tags required)"""
-    return create_question_service(question, current_user)
+    return await service_pool.run(create_question_service, question, current_user)
 
 @router.get("/get-questions", response_model=QuestionListResponse)
 async def get_questions(
     page: int = 1,
     limit: int = 10,
     search: Optional[str] = None,
-    tags: Optional[str] = None 
+    tags: Optional[str] = None,
+    sort: str = "newest",  # newest, relevance (with search), hot, votes, unanswered, active
+    tag_mode: str = "all",  # all, any
+    after: Optional[str] = None  # next_cursor of the previous page
 ):
     """Retrieve questions with filtering, pagination, and search"""
     
-    tag_list = tags.split(",") if tags else None
-    return get_questions_service(page, limit, search, tag_list)
+    tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else None
+    body = await service_pool.run(get_questions_service, page, limit, search, tag_list, sort, tag_mode, after)
+    return JSONBytesResponse(body)
 
 @router.get("/get-specific-questions/{question_id}", response_model=QuestionResponse)
-async def get_question(question_id: str):
-    """Get specific question details"""
-    return get_question_by_id_service(question_id)
+async def get_question(question_id: str, request: Request):
+    """Get specific question details (supports If-None-Match / If-Modified-Since)"""
+    cached = await service_pool.run(get_question_by_id_service, question_id)
+    return cached.response(request)
 
 @router.put("/update-questions/{question_id}", response_model=QuestionResponse)
 async def update_question(
@@ -100,7 +119,7 @@ async def update_question(
     current_user: dict = Depends(get_current_user)
 ):
     """Update question (for question owner only)"""
-    return update_question_service(question_id, question, current_user)
+    return await service_pool.run(update_question_service, question_id, question, current_user)
 
 @router.delete("/delete-questions/{question_id}")
 async def delete_question(
@@ -108,7 +127,7 @@ async def delete_question(
     current_user: dict = Depends(get_current_user)
 ):
     """Delete question (admin/owner permissions)"""
-    return delete_question_service(question_id, current_user)
+    return await service_pool.run(delete_question_service, question_id, current_user)
 
 
 # answer management routes
@@ -119,15 +138,17 @@ async def create_answer(
     current_user: dict = Depends(get_current_user)
 ):
     """Post an answer to a specific question"""
-    return create_answer_service(question_id, answer, current_user)
+    return await service_pool.run(create_answer_service, question_id, answer, current_user)
 
 @router.get("/questions/{question_id}/answers", response_model=AnswerListResponse)
 async def get_answers(
     question_id: str,
+    request: Request,
     sort: str = "newest"  # newest, oldest, votes
 ):
-    """Get all answers for a question"""
-    return get_answers_service(question_id, sort)
+    """Get all answers for a question (supports If-None-Match / If-Modified-Since)"""
+    cached = await service_pool.run(get_cached_answers_service, question_id, sort)
+    return cached.response(request)
 
 @router.put("/answers/{answer_id}", response_model=AnswerResponse)
 async def update_answer(
@@ -136,7 +157,7 @@ async def update_answer(
     current_user: dict = Depends(get_current_user)
 ):
     """Update an answer (author only)"""
-    return update_answer_service(answer_id, answer, current_user)
+    return await service_pool.run(update_answer_service, answer_id, answer, current_user)
 
 @router.delete("/answers/{answer_id}")
 async def delete_answer(
@@ -144,7 +165,7 @@ async def delete_answer(
     current_user: dict = Depends(get_current_user)
 ):
     """Delete an answer (author/admin only)"""
-    return delete_answer_service(answer_id, current_user)
+    return await service_pool.run(delete_answer_service, answer_id, current_user)
 
 @router.post("/answers/{answer_id}/accept", response_model=AnswerResponse)
 async def accept_answer(
@@ -152,7 +173,7 @@ async def accept_answer(
     current_user: dict = Depends(get_current_user)
 ):
     """Mark answer as accepted (question owner only)"""
-    return accept_answer_service(answer_id, current_user)
+    return await service_pool.run(accept_answer_service, answer_id, current_user)
 
 
 # voting routes
@@ -164,7 +185,7 @@ async def vote_answer(
     current_user: dict = Depends(get_current_user)
 ):
     """Upvote or downvote an answer"""
-    return vote_answer_service(answer_id, vote, current_user)
+    return await service_pool.run(vote_answer_service, answer_id, vote, current_user)
 
 @router.delete("/answers/{answer_id}/vote", response_model=VoteResult)
 async def remove_vote(
@@ -172,17 +193,18 @@ async def remove_vote(
     current_user: dict = Depends(get_current_user)
 ):
     """Remove vote from an answer"""
-    return remove_vote_service(answer_id, current_user)
+    return await service_pool.run(remove_vote_service, answer_id, current_user)
 
 
 # tag management routes
 @router.get("/tags", response_model=TagListResponse)
 async def get_tags(
     search: Optional[str] = None,
-    limit: int = 100
+    limit: int = 100,
+    fuzzy: bool = False  # also match prefixes one typo away
 ):
     """Get available tags for multi-select dropdown"""
-    return get_tags_service(search, limit)
+    return await service_pool.run(get_tags_service, search, limit, fuzzy)
 
 @router.post("/tags", response_model=TagResponse)
 async def create_tag(
@@ -190,7 +212,7 @@ async def create_tag(
     current_user: dict = Depends(get_current_user)
 ):
     """Create new tag (returns immediately, will be saved when used in question)"""
-    return create_tag_service(tag, current_user)
+    return await service_pool.run(create_tag_service, tag, current_user)
 
 #admin routes
 @router.post("/admin/ban-user")
@@ -199,7 +221,7 @@ async def admin_ban_user(
     current_user: dict = Depends(get_current_user)
 ):
     """Ban users who violate platform policies"""
-    return admin_ban_user_service(ban_request, current_user)
+    return await service_pool.run(admin_ban_user_service, ban_request, current_user)
 
 @router.post("/admin/messages")
 async def admin_send_message(
@@ -207,7 +229,7 @@ async def admin_send_message(
     current_user: dict = Depends(get_current_user)
 ):
     """Send platform-wide messages"""
-    return admin_send_message_service(message, current_user)
+    return await service_pool.run(admin_send_message_service, message, current_user)
 
 @router.delete("/admin/moderate/{content_type}/{content_id}")
 async def admin_reject_content(
@@ -216,14 +238,51 @@ async def admin_reject_content(
     current_user: dict = Depends(get_current_user)
 ):
     """Reject inappropriate content (removes it)"""
-    return admin_reject_content_service(content_type, content_id, current_user)
+    return await service_pool.run(admin_reject_content_service, content_type, content_id, current_user)
+
+@router.post("/admin/reconcile-votes")
+async def admin_reconcile_votes(
+    current_user: dict = Depends(get_current_user)
+):
+    """Rebuild answer vote tallies from the recorded votes"""
+    return await service_pool.run(admin_reconcile_votes_service, current_user)
+
+@router.post("/admin/collect-orphans")
+async def admin_collect_orphans(
+    current_user: dict = Depends(get_current_user)
+):
+    """Remove answers, votes and notifications whose question or answer is gone"""
+    return await service_pool.run(admin_collect_orphans_service, current_user)
+
+@router.post("/admin/import", response_model=AdminImportResponse)
+async def admin_import(
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """Seed questions, answers and votes from a JSONL file (all or nothing)"""
+    content = await file.read()
+    return await service_pool.run(admin_import_service, content, current_user)
+
+@router.get("/admin/cache-stats")
+async def admin_cache_stats(
+    current_user: dict = Depends(get_current_user)
+):
+    """Hit/miss counters of the in-process caches"""
+    return await service_pool.run(admin_cache_stats_service, current_user)
+
+@router.get("/admin/metrics")
+async def admin_metrics(
+    current_user: dict = Depends(get_current_user)
+):
+    """Queue depth and throughput of the background worker pools"""
+    return await service_pool.run(admin_metrics_service, current_user)
 
 @router.get("/admin/reports")
 async def admin_get_reports(
     current_user: dict = Depends(get_current_user)
 ):
     """Download basic activity reports"""
-    return admin_get_reports_service(current_user)
+    return await service_pool.run(admin_get_reports_service, current_user)
 
 
 
@@ -233,7 +292,27 @@ async def get_notifications(
     current_user: dict = Depends(get_current_user)
 ):
     """Fetch user notifications for bell dropdown"""
-    return get_user_notifications_service(current_user)
+    body = await service_pool.run(get_user_notifications_service, current_user)
+    return JSONBytesResponse(body)
+
+@router.post("/notifications/stream-ticket", response_model=NotificationStreamTicket)
+async def create_stream_ticket(
+    current_user: dict = Depends(get_current_user)
+):
+    """Ticket for opening /notifications/stream, which EventSource can't authorize with a header"""
+    return create_stream_ticket_service(current_user)
+
+@router.get("/notifications/stream")
+async def stream_notifications(
+    request: Request,
+    current_user: dict = Depends(get_stream_user)
+):
+    """Push new notifications as Server-Sent Events instead of polling"""
+    return StreamingResponse(
+        stream_notifications_service(current_user, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(
@@ -241,19 +320,28 @@ async def mark_notification_read(
     current_user: dict = Depends(get_current_user)
 ):
     """Mark notification as read"""
-    return mark_notification_read_service(notification_id, current_user)
+    return await service_pool.run(mark_notification_read_service, notification_id, current_user)
 
 @router.put("/notifications/read-all")
 async def mark_all_notifications_read(
     current_user: dict = Depends(get_current_user)
 ):
     """Mark all notifications as read"""
-    return mark_all_notifications_read_service(current_user)
+    return await service_pool.run(mark_all_notifications_read_service, current_user)
 
 #ai route
 @router.post("/questions/answers_ai", response_model=AIAnswerResponse)
 async def get_ai_answer(
     question_request: AIQuestionRequest
 ):
-    """Get AI-generated answer using Gemini 2.0 Flash"""
-    return get_ai_answer_service(question_request)
\ No newline at end of file
+    """Get AI-generated answer (async, bounded and time-limited)"""
+    return await get_ai_answer_service(question_request)
+
+@router.get("/questions/answers_ai/stream")
+async def stream_ai_answer(question: str, request: Request):
+    """Stream an AI-generated answer as Server-Sent Events (works with EventSource)"""
+    return StreamingResponse(
+        stream_ai_answer_service(question, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
\ No newline at end of file
@@ -0,0 +1,272 @@
+import base64
+import json
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from heapq import merge
+from app.database import questions_table
+
+TAG_PATTERN = re.compile(r"<[^>]*>|&\w+;")
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str):
+    """Lowercase word tokens of a text, ignoring HTML from the rich text editor"""
+    return TOKEN_PATTERN.findall(TAG_PATTERN.sub(" ", text or "").lower())
+
+
+class QuestionIndex:
+    """Base for in-memory indexes derived from the questions table
+
+    The index is built from ``loader`` on first use and then kept current
+    by calling add() and remove() whenever a question is written.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            # Read the table before taking the index lock, never while holding it.
+            # A write racing with the load is applied by its own add()/remove().
+            questions = self._loader()
+            with self._lock:
+                if not self._loaded:
+                    for question in questions:
+                        self._add(question)
+                    self._loaded = True
+
+    def add(self, question: dict):
+        """Index a question, replacing any previous version of it"""
+        self._ensure_loaded()
+        with self._lock:
+            self._remove(question["id"])
+            self._add(question)
+
+    def remove(self, question_id: str):
+        self._ensure_loaded()
+        with self._lock:
+            self._remove(question_id)
+
+    def _add(self, question):
+        raise NotImplementedError
+
+    def _remove(self, question_id):
+        raise NotImplementedError
+
+
+class FullTextIndex(QuestionIndex):
+    """Inverted index over question titles and descriptions, ranked with BM25
+
+    Every query word matches indexed terms it is a prefix of ("reac" finds
+    "react"); exact matches score higher than prefix-only ones. A question
+    must match every query word.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    TITLE_WEIGHT = 2
+    PREFIX_WEIGHT = 0.5
+
+    def __init__(self, loader):
+        super().__init__(loader)
+        self._postings = {}  # term -> {question_id: term frequency}
+        self._doc_terms = {}  # question_id -> {term: term frequency}
+        self._doc_lengths = {}
+        self._total_length = 0
+        self._vocabulary = []  # sorted terms, for prefix lookups
+
+    def _add(self, question):
+        terms = {}
+        for term in tokenize(question.get("title")):
+            terms[term] = terms.get(term, 0) + self.TITLE_WEIGHT
+        for term in tokenize(question.get("description")):
+            terms[term] = terms.get(term, 0) + 1
+
+        question_id = question["id"]
+        for term, frequency in terms.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                insort(self._vocabulary, term)
+            self._postings[term][question_id] = frequency
+
+        self._doc_terms[question_id] = terms
+        self._doc_lengths[question_id] = sum(terms.values())
+        self._total_length += self._doc_lengths[question_id]
+
+    def _remove(self, question_id):
+        terms = self._doc_terms.pop(question_id, None)
+        if terms is None:
+            return
+
+        for term in terms:
+            postings = self._postings[term]
+            del postings[question_id]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+
+        self._total_length -= self._doc_lengths.pop(question_id)
+
+    def _expand(self, prefix):
+        """Indexed terms starting with ``prefix``"""
+        start = bisect_left(self._vocabulary, prefix)
+        end = start
+        while end < len(self._vocabulary) and self._vocabulary[end].startswith(prefix):
+            end += 1
+        return self._vocabulary[start:end]
+
+    def search(self, query: str):
+        """Return {question_id: score} for questions matching every query word"""
+        self._ensure_loaded()
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return {}
+
+        with self._lock:
+            total_docs = len(self._doc_lengths)
+            if not total_docs:
+                return {}
+            average_length = self._total_length / total_docs
+
+            scores = None
+            for word in words:
+                word_scores = {}
+                for term in self._expand(word):
+                    postings = self._postings[term]
+                    weight = 1.0 if term == word else self.PREFIX_WEIGHT
+                    idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for question_id, frequency in postings.items():
+                        length_norm = 1 - self.B + self.B * self._doc_lengths[question_id] / average_length
+                        score = idf * frequency * (self.K1 + 1) / (frequency + self.K1 * length_norm)
+                        word_scores[question_id] = word_scores.get(question_id, 0.0) + weight * score
+
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {
+                        question_id: score + word_scores[question_id]
+                        for question_id, score in scores.items()
+                        if question_id in word_scores
+                    }
+                if not scores:
+                    return {}
+
+            return scores
+
+
+def intersect_sorted(lists):
+    """Intersect sorted id lists, probing the longer lists by bisection"""
+    lists = sorted(lists, key=len)
+    result = lists[0] if lists else []
+    for other in lists[1:]:
+        matched = []
+        for item in result:
+            position = bisect_left(other, item)
+            if position < len(other) and other[position] == item:
+                matched.append(item)
+        result = matched
+        if not result:
+            break
+    return list(result)
+
+def union_sorted(lists):
+    """Merge sorted id lists into one sorted list without duplicates"""
+    result = []
+    for item in merge(*lists):
+        if not result or result[-1] != item:
+            result.append(item)
+    return result
+
+
+class TagIndex(QuestionIndex):
+    """Sorted posting lists of question ids per lowercase tag"""
+
+    def __init__(self, loader):
+        super().__init__(loader)
+        self._postings = {}  # tag -> sorted question ids
+        self._question_tags = {}  # question_id -> set of tags
+
+    def _add(self, question):
+        tags = {tag.lower() for tag in question.get("tags") or []}
+        for tag in tags:
+            insort(self._postings.setdefault(tag, []), question["id"])
+        self._question_tags[question["id"]] = tags
+
+    def _remove(self, question_id):
+        for tag in self._question_tags.pop(question_id, ()):
+            postings = self._postings[tag]
+            del postings[bisect_left(postings, question_id)]
+            if not postings:
+                del self._postings[tag]
+
+    def match(self, tags, mode: str = "all"):
+        """Sorted ids of questions having all (or, with mode="any", any) of the tags"""
+        self._ensure_loaded()
+        with self._lock:
+            lists = [self._postings.get(tag, []) for tag in {tag.lower() for tag in tags}]
+            if mode == "any":
+                return union_sorted(lists)
+            return intersect_sorted(lists)
+
+
+def newest_keys(keys, limit: int, offset: int = 0, before=None):
+    """Newest-first slice of ascending (created_at, id) keys older than ``before``"""
+    end = bisect_left(keys, before) if before is not None else len(keys)
+    end -= offset
+    if end <= 0 or limit <= 0:
+        return []
+    return keys[max(0, end - limit):end][::-1]
+
+def encode_cursor(key):
+    """Opaque pagination token for a (created_at, id) key"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, question_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(question_id, str):
+        raise ValueError("Invalid cursor")
+    return (created_at, question_id)
+
+
+class RecencyIndex(QuestionIndex):
+    """Question (created_at, id) keys in ascending order, for newest-first paging"""
+
+    def __init__(self, loader):
+        super().__init__(loader)
+        self._keys = []
+        self._key_by_id = {}
+
+    def _add(self, question):
+        key = (question["created_at"], question["id"])
+        insort(self._keys, key)
+        self._key_by_id[question["id"]] = key
+
+    def _remove(self, question_id):
+        key = self._key_by_id.pop(question_id, None)
+        if key is not None:
+            del self._keys[bisect_left(self._keys, key)]
+
+    def count(self) -> int:
+        self._ensure_loaded()
+        return len(self._keys)
+
+    def key(self, question_id: str):
+        self._ensure_loaded()
+        return self._key_by_id.get(question_id)
+
+    def newest(self, limit: int, offset: int = 0, before=None):
+        """Newest-first keys of all questions, skipping ``offset`` or starting after ``before``"""
+        self._ensure_loaded()
+        with self._lock:
+            return newest_keys(self._keys, limit, offset, before)
+
+
+question_search = FullTextIndex(questions_table.all)
+question_tags = TagIndex(questions_table.all)
+question_recency = RecencyIndex(questions_table.all)
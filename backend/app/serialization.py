@@ -0,0 +1,41 @@
+import json
+from fastapi import Response
+from pydantic_core import PydanticUndefined
+
+try:
+    import orjson
+except ImportError:  # optional, several times faster than the json module
+    orjson = None
+
+
+# Rows are validated by the models when they are written, so list
+# endpoints serialize them as stored instead of building one response model
+# per row and having FastAPI validate it all again. Datetimes are stored as
+# ISO strings, which is how the models serialize them anyway.
+
+_fields = {}  # model -> ((field name, default), ...)
+
+def response_rows(model, rows):
+    """Stored rows reduced to the fields of ``model``, with its defaults filled in"""
+    fields = _model_fields(model)
+    return [
+        {name: row[name] if default is PydanticUndefined else row.get(name, default) for name, default in fields}
+        for row in rows
+    ]
+
+def _model_fields(model):
+    if model not in _fields:
+        _fields[model] = tuple((name, field.default) for name, field in model.model_fields.items())
+    return _fields[model]
+
+def dump_json(content) -> bytes:
+    """Compact JSON of plain dicts, lists and scalars"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class JSONBytesResponse(Response):
+    """Response for a body that is already serialized JSON"""
+
+    media_type = "application/json"
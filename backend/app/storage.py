@@ -0,0 +1,340 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from tinydb.table import Document
+
+
+# Storage backends expose the subset of the TinyDB ``Table`` API used by the
+# services (insert, insert_multiple, all, search, get, contains, update,
+# upsert, remove, truncate, count, len/iter), so app/auth.py works unchanged
+# whichever backend is configured.
+
+# Process umask, for the mode of files created by write_file_atomic (it can
+# only be read by setting it, so once at import)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def write_file_atomic(path: str, content: bytes):
+    """Replace a file with ``content`` via a temp file and rename
+
+    Readers and crashes never see a half-written file. The file keeps its
+    permissions, or gets the usual ones for a new file, rather than the
+    0600 of the temp file.
+    """
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def query_equalities(cond):
+    """Extract top-level ``field == value`` constraints from a TinyDB query"""
+    query_hash = getattr(cond, "_hash", None)
+    equalities = {}
+    _collect_equalities(query_hash, equalities)
+    return equalities
+
+def _collect_equalities(query_hash, equalities):
+    if not isinstance(query_hash, tuple) or not query_hash:
+        return
+
+    if query_hash[0] == "==" and len(query_hash[1]) == 1:
+        value = query_hash[2]
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            equalities[query_hash[1][0]] = value
+    elif query_hash[0] == "and":
+        for part in query_hash[1]:
+            _collect_equalities(part, equalities)
+
+def index_fields(indexes):
+    """Flatten an index spec (names and name tuples) into unique field names"""
+    fields = []
+    for index in indexes:
+        for field in (index if isinstance(index, tuple) else (index,)):
+            if field not in fields:
+                fields.append(field)
+    return fields
+
+
+class SQLiteTable:
+    """A table stored as JSON rows with the indexed fields as real columns"""
+
+    def __init__(self, database, name, indexes):
+        self._db = database
+        self.name = name
+        self._columns = index_fields(indexes)
+
+        columns = "".join(f', "{column}"' for column in self._columns)
+        with self._db.write():
+            self._db.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{name}" '
+                f'(doc_id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL{columns})'
+            )
+            # Tables created before a field was indexed get its column filled in from the rows
+            existing = {row[1] for row in self._db.conn.execute(f'PRAGMA table_info("{name}")')}
+            for column in self._columns:
+                if column not in existing:
+                    self._db.conn.execute(f'ALTER TABLE "{name}" ADD COLUMN "{column}"')
+                    self._db.conn.execute(
+                        f'UPDATE "{name}" SET "{column}" = json_extract(data, ?)', (f'$."{column}"',)
+                    )
+            for index in indexes:
+                fields = index if isinstance(index, tuple) else (index,)
+                index_name = f"idx_{name}_{'_'.join(fields)}"
+                field_list = ", ".join(f'"{field}"' for field in fields)
+                self._db.conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{name}" ({field_list})'
+                )
+
+    def __repr__(self):
+        return f"<SQLiteTable name={self.name!r}, total={len(self)}>"
+
+    def _row_values(self, document):
+        values = [json.dumps(document)]
+        for column in self._columns:
+            value = document.get(column)
+            if value is not None and not isinstance(value, (str, int, float)):
+                value = json.dumps(value)
+            values.append(value)
+        return values
+
+    def _select(self, cond=None, doc_ids=None):
+        """Fetch candidate rows, pushing indexed equalities down into SQL"""
+        sql = f'SELECT doc_id, data FROM "{self.name}"'
+        params = []
+
+        if doc_ids is not None:
+            doc_ids = list(doc_ids)
+            if not doc_ids:
+                return []
+            sql += f" WHERE doc_id IN ({', '.join('?' for _ in doc_ids)})"
+            params = doc_ids
+        elif cond is not None:
+            equalities = query_equalities(cond)
+            clauses = [column for column in self._columns if column in equalities]
+            if clauses:
+                sql += " WHERE " + " AND ".join(f'"{column}" = ?' for column in clauses)
+                params = [equalities[column] for column in clauses]
+
+        sql += " ORDER BY doc_id"
+        rows = self._db.reader().execute(sql, params).fetchall()
+
+        docs = [Document(json.loads(data), doc_id) for doc_id, data in rows]
+        if cond is not None and doc_ids is None:
+            docs = [doc for doc in docs if cond(doc)]
+        return docs
+
+    def insert(self, document):
+        placeholders = ", ".join("?" for _ in range(len(self._columns) + 1))
+        columns = "".join(f', "{column}"' for column in self._columns)
+        with self._db.write():
+            cursor = self._db.conn.execute(
+                f'INSERT INTO "{self.name}" (data{columns}) VALUES ({placeholders})',
+                self._row_values(dict(document))
+            )
+        return cursor.lastrowid
+
+    def insert_multiple(self, documents):
+        rows = [self._row_values(dict(document)) for document in documents]
+        if not rows:
+            return []
+        placeholders = ", ".join("?" for _ in range(len(self._columns) + 1))
+        columns = "".join(f', "{column}"' for column in self._columns)
+        with self._db.write():
+            self._db.conn.executemany(
+                f'INSERT INTO "{self.name}" (data{columns}) VALUES ({placeholders})', rows
+            )
+            # AUTOINCREMENT ids are consecutive within the write transaction
+            last_id = self._db.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+    def all(self):
+        return self._select()
+
+    def search(self, cond):
+        return self._select(cond)
+
+    def get(self, cond=None, doc_id=None, doc_ids=None):
+        if doc_id is not None:
+            docs = self._select(doc_ids=[doc_id])
+            return docs[0] if docs else None
+        if doc_ids is not None:
+            return self._select(doc_ids=doc_ids)
+        if cond is not None:
+            docs = self._select(cond)
+            return docs[0] if docs else None
+        raise RuntimeError("You have to pass either cond or doc_id or doc_ids")
+
+    def contains(self, cond=None, doc_id=None):
+        return self.get(cond, doc_id=doc_id) is not None
+
+    def update(self, fields, cond=None, doc_ids=None):
+        assignments = ", ".join(["data = ?"] + [f'"{column}" = ?' for column in self._columns])
+        with self._db.write():
+            docs = self._select(cond, doc_ids)
+            for doc in docs:
+                if callable(fields):
+                    fields(doc)
+                else:
+                    doc.update(fields)
+                self._db.conn.execute(
+                    f'UPDATE "{self.name}" SET {assignments} WHERE doc_id = ?',
+                    self._row_values(doc) + [doc.doc_id]
+                )
+        return [doc.doc_id for doc in docs]
+
+    def upsert(self, document, cond=None):
+        with self._db.write():
+            updated_ids = self.update(document, cond)
+            if updated_ids:
+                return updated_ids
+            return [self.insert(document)]
+
+    def remove(self, cond=None, doc_ids=None):
+        if cond is None and doc_ids is None:
+            raise RuntimeError("Use truncate() to remove all documents")
+
+        with self._db.write():
+            removed_ids = [doc.doc_id for doc in self._select(cond, doc_ids)]
+            self._db.conn.executemany(
+                f'DELETE FROM "{self.name}" WHERE doc_id = ?',
+                [(doc_id,) for doc_id in removed_ids]
+            )
+        return removed_ids
+
+    def truncate(self):
+        with self._db.write():
+            self._db.conn.execute(f'DELETE FROM "{self.name}"')
+
+    def count(self, cond):
+        return len(self.search(cond))
+
+    def clear_cache(self):
+        pass
+
+    def __len__(self):
+        return self._db.reader().execute(f'SELECT COUNT(*) FROM "{self.name}"').fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.all())
+
+
+class SQLiteDatabase:
+    """SQLite (WAL mode) database handing out TinyDB-compatible tables
+
+    All writes go through one connection, serialized by ``lock``. Reads
+    use a connection per thread, so in WAL mode they run concurrently with
+    each other and with a writer, each seeing the last committed state. A
+    thread reading inside its own write transaction uses the writer's
+    connection so it sees its uncommitted changes.
+    """
+
+    def __init__(self, path, indexes, lock=None):
+        self.path = path
+        self._indexes = indexes
+        self._tables = {}
+        self._depth = 0
+        self._writer = None
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self.lock = lock or threading.RLock()
+
+        self.conn = self._connect()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def reader(self):
+        """Connection for reads by the current thread"""
+        if self._writer == threading.get_ident():
+            return self.conn
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def write(self):
+        """Run the enclosed statements as one transaction (nesting is flattened)"""
+        with self.lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._writer = threading.get_ident()
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._writer = None
+                    self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._writer = None
+                    self.conn.execute("COMMIT")
+
+    def transaction(self):
+        """Same as write(): the enclosed writes commit or roll back together"""
+        return self.write()
+
+    def table(self, name):
+        if name not in self._tables:
+            self._tables[name] = SQLiteTable(self, name, self._indexes.get(name, ["id"]))
+        return self._tables[name]
+
+    def tables(self):
+        rows = self.reader().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def import_tinydb(self, json_path):
+        """Copy every table of a TinyDB JSON file into this database"""
+        with open(json_path) as f:
+            content = f.read()
+        data = json.loads(content) if content.strip() else {}
+
+        with self.write():
+            for name, documents in data.items():
+                self.table(name).insert_multiple(documents.values())
+
+    def close(self):
+        with self.lock, self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            self.conn.close()
+
+
+def open_sqlite_database(path, indexes, migrate_from=None, lock=None):
+    """Open a SQLite database, seeding it from a TinyDB file on first use"""
+    is_new = not os.path.exists(path)
+    database = SQLiteDatabase(path, indexes, lock)
+
+    if is_new and migrate_from and os.path.exists(migrate_from):
+        database.import_tinydb(migrate_from)
+    return database
@@ -0,0 +1,263 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from tinydb import Query
+from app.database import tags_table, questions_table, db_lock
+
+
+class _TrieNode:
+    __slots__ = ("children", "tag", "top", "count")
+
+    def __init__(self):
+        self.children = {}
+        self.tag = None  # tag name ending at this node
+        self.top = []  # best TOP_K tag names in this subtree
+        self.count = 0  # tags in this subtree
+
+
+class TagTrie:
+    """Prefix trie over tag names where every node caches its top-K tags
+
+    ``rank`` maps a tag name to its sort key (most used first). A prefix
+    query walks len(prefix) nodes and reads the cached list; only requests
+    for more than TOP_K tags (the default ``limit`` of ``GET /tags``) fall
+    back to walking the subtree. When a tag's usage changes, the caches on
+    its path are rebuilt bottom-up from the children's caches.
+    """
+
+    TOP_K = 100
+
+    def __init__(self, rank):
+        self._rank = rank
+        self._root = _TrieNode()
+
+    def _path(self, name):
+        nodes = [self._root]
+        for char in name:
+            node = nodes[-1].children.get(char)
+            if node is None:
+                return None
+            nodes.append(node)
+        return nodes
+
+    def _refresh(self, nodes):
+        for node in reversed(nodes):
+            candidates = [node.tag] if node.tag is not None else []
+            for child in node.children.values():
+                candidates.extend(child.top)
+            node.top = heapq.nsmallest(self.TOP_K, candidates, key=self._rank)
+
+    def update(self, name: str):
+        """Insert a tag, or re-rank it after its usage changed"""
+        nodes = [self._root]
+        for char in name:
+            nodes.append(nodes[-1].children.setdefault(char, _TrieNode()))
+
+        if nodes[-1].tag is None:
+            nodes[-1].tag = name
+            for node in nodes:
+                node.count += 1
+        self._refresh(nodes)
+
+    def remove(self, name: str):
+        nodes = self._path(name)
+        if nodes is None or nodes[-1].tag is None:
+            return
+
+        nodes[-1].tag = None
+        for node in nodes:
+            node.count -= 1
+
+        # Prune nodes that no longer lead to any tag
+        for depth in range(len(name), 0, -1):
+            if nodes[depth].count:
+                break
+            del nodes[depth - 1].children[name[depth - 1]]
+            nodes.pop()
+        self._refresh(nodes)
+
+    def _subtree_tags(self, node):
+        stack, tags = [node], []
+        while stack:
+            node = stack.pop()
+            if node.tag is not None:
+                tags.append(node.tag)
+            stack.extend(node.children.values())
+        return tags
+
+    def _best(self, nodes, limit):
+        if limit <= self.TOP_K:
+            candidates = {name for node in nodes for name in node.top}
+        else:
+            candidates = {name for node in nodes for name in self._subtree_tags(node)}
+        return heapq.nsmallest(limit, candidates, key=self._rank)
+
+    def _fuzzy_nodes(self, prefix):
+        """Nodes whose path is within one edit (incl. transposition) of ``prefix``, by path"""
+        found = {}
+        stack = [(self._root, "", 0, False)]
+        while stack:
+            node, path, i, edited = stack.pop()
+            if i == len(prefix):
+                found[path] = node
+                if edited:
+                    continue
+            if i < len(prefix) and prefix[i] in node.children:
+                stack.append((node.children[prefix[i]], path + prefix[i], i + 1, edited))
+            if edited:
+                continue
+            if i < len(prefix):
+                # Deleted, substituted or transposed character
+                stack.append((node, path, i + 1, True))
+                for char, child in node.children.items():
+                    if char != prefix[i]:
+                        stack.append((child, path + char, i + 1, True))
+                if i + 1 < len(prefix) and prefix[i + 1] in node.children:
+                    swapped = node.children[prefix[i + 1]].children.get(prefix[i])
+                    if swapped is not None:
+                        stack.append((swapped, path + prefix[i + 1] + prefix[i], i + 2, True))
+            # Inserted character
+            for char, child in node.children.items():
+                stack.append((child, path + char, i, True))
+        return found
+
+    def search(self, prefix: str, limit: int, fuzzy: bool = False):
+        """Best tags starting with ``prefix`` and the number of tags that do
+
+        With ``fuzzy``, tags whose start is one typo away from the prefix
+        are listed after the exact prefix matches, and counted in the total.
+        """
+        nodes = self._path(prefix)
+        tags = self._best([nodes[-1]], limit) if nodes else []
+        total = nodes[-1].count if nodes else 0
+
+        if fuzzy:
+            found = self._fuzzy_nodes(prefix)
+            found.pop(prefix, None)
+            if len(tags) < limit:
+                exact = set(tags)
+                extra = [name for name in self._best(list(found.values()), limit) if name not in exact]
+                tags += extra[:limit - len(tags)]
+            total += self._fuzzy_count(prefix, found, total)
+        return tags, total
+
+    @staticmethod
+    def _fuzzy_count(prefix, found, exact_count):
+        """Tags under the ``found`` nodes (by path) that don't start with ``prefix``"""
+        # Matched nodes can lie inside each other's subtrees; count each
+        # outermost one once, minus the exact prefix's subtree if it holds it
+        count = 0
+        outer = None
+        for path in sorted(found):  # subtrees are contiguous in sorted order
+            if path.startswith(prefix) or (outer is not None and path.startswith(outer)):
+                continue
+            outer = path
+            count += found[path].count
+            if prefix.startswith(path):
+                count -= exact_count
+        return count
+
+
+class TagStats:
+    """Materialized tag usage counts, stored in tags_table
+
+    Each row maps a lowercase tag ``name`` to its ``display_name`` (the most
+    recent capitalization) and ``usage_count``. Counts change incrementally
+    as questions are written. An in-memory copy sorted by usage and by name
+    answers top-K and prefix queries without scanning every tag.
+
+    Counts are applied as deltas, so they are loaded up front rather than
+    lazily: a lazy load triggered by a question write would count it twice.
+    """
+
+    def __init__(self, table, questions):
+        self.table = table
+        self._lock = threading.RLock()
+        self._tags = {}  # name -> row
+        self._by_usage = []  # sorted (-usage_count, name)
+        self._trie = TagTrie(lambda name: (-self._tags[name]["usage_count"], name))
+
+        rows = self.table.all()
+        if not rows and len(questions):
+            # First start with existing questions: build the table once
+            counts = {}
+            for question in questions.all():
+                for name, display_name in {tag.lower(): tag for tag in question.get("tags") or []}.items():
+                    row = counts.setdefault(name, {"name": name, "usage_count": 0})
+                    row["display_name"] = display_name
+                    row["usage_count"] += 1
+            rows = list(counts.values())
+            self.table.insert_multiple(rows)
+
+        for row in rows:
+            self._store(dict(row))
+
+    def _store(self, row):
+        """Insert or replace a row in the in-memory structures"""
+        old = self._tags.get(row["name"])
+        if old is not None:
+            del self._by_usage[bisect_left(self._by_usage, (-old["usage_count"], old["name"]))]
+        self._tags[row["name"]] = row
+        insort(self._by_usage, (-row["usage_count"], row["name"]))
+        self._trie.update(row["name"])
+
+    def _discard(self, name):
+        row = self._tags[name]
+        del self._by_usage[bisect_left(self._by_usage, (-row["usage_count"], name))]
+        self._trie.remove(name)
+        del self._tags[name]
+
+    def apply(self, old_tags, new_tags):
+        """Update counts for a question whose tags changed from old_tags to new_tags"""
+        old = {tag.lower(): tag for tag in old_tags or []}
+        new = {tag.lower(): tag for tag in new_tags or []}
+
+        # db_lock first: callers may already hold it, and it must always be
+        # taken before self._lock
+        with db_lock, self._lock:
+            for name in old.keys() - new.keys():
+                self._change(name, None, -1)
+            for name, display_name in new.items():
+                self._change(name, display_name, 0 if name in old else 1)
+
+    def _change(self, name, display_name, delta):
+        Tag = Query()
+        row = self._tags.get(name)
+        if row is None and delta <= 0:
+            return
+
+        usage_count = (row["usage_count"] if row else 0) + delta
+        if row is not None and delta == 0 and display_name in (None, row["display_name"]):
+            return
+
+        if usage_count <= 0:
+            self._discard(name)
+            self.table.remove(Tag.name == name)
+            return
+
+        row = {
+            "name": name,
+            "display_name": display_name or row["display_name"],
+            "usage_count": usage_count
+        }
+        self._store(row)
+        self.table.upsert(row, Tag.name == name)
+
+    def usage(self, name: str) -> int:
+        row = self._tags.get(name.lower())
+        return row["usage_count"] if row else 0
+
+    def top(self, limit: int, prefix: str = None, fuzzy: bool = False):
+        """Most used tags, optionally only those starting with ``prefix``
+
+        Returns the rows and the total number of matching tags.
+        """
+        with self._lock:
+            if not prefix:
+                return [self._tags[name] for _, name in self._by_usage[:limit]], len(self._tags)
+
+            names, total = self._trie.search(prefix.lower(), limit, fuzzy)
+            return [self._tags[name] for name in names], total
+
+
+tag_stats = TagStats(tags_table, questions_table)
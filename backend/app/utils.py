@@ -2,8 +2,16 @@ import jwt
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from app.config import settings
+from app.workers import WorkerPool
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with a different cost factor are flagged for rehashing on login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds
+)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -11,6 +19,27 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+
+class PasswordHasher(WorkerPool):
+    """Worker pool for bcrypt, so hashing never blocks the event loop
+
+    bcrypt releases the GIL, so the worker threads hash in parallel.
+    """
+
+    def __init__(self, context, workers: int, max_queue: int):
+        super().__init__("password-hash", workers, max_queue)
+        self.context = context
+
+    async def hash(self, password: str) -> str:
+        return await self.run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """Check a password; also return a new hash if the stored one uses an outdated cost"""
+        return await self.run(self.context.verify_and_update, password, hashed_password)
+
+
+password_hasher = PasswordHasher(pwd_context, settings.password_hash_workers, settings.password_hash_max_queue)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
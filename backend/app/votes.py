@@ -0,0 +1,430 @@
+import json
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+from tinydb.table import Document
+from app.storage import query_equalities, write_file_atomic
+
+VOTE_TYPES = {"upvote": 1, "downvote": -1}
+VOTE_NAMES = {value: name for name, value in VOTE_TYPES.items()}
+
+EPOCH = datetime(1970, 1, 1)
+FILE_MAGIC = b"STACKIT-VOTES\x01"
+
+
+def to_micros(timestamp: str) -> int:
+    """ISO timestamp (naive means UTC) as microseconds since the epoch
+
+    Anything unreadable, which only old or hand-written data might hold,
+    is taken as the epoch rather than failing the whole load.
+    """
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return 0
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+def from_micros(micros: int) -> str:
+    return (EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+class Interner:
+    """Two-way mapping between strings and small consecutive ints"""
+
+    __slots__ = ("strings", "_ids")
+
+    def __init__(self, strings=()):
+        self.strings = list(strings)
+        self._ids = {string: index for index, string in enumerate(self.strings)}
+
+    def intern(self, string: str) -> int:
+        index = self._ids.get(string)
+        if index is None:
+            index = self._ids[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    def lookup(self, string: str):
+        """Index of a string seen before, or None"""
+        return self._ids.get(string)
+
+    def __getitem__(self, index: int) -> str:
+        return self.strings[index]
+
+
+class AnswerVotes:
+    """Votes on one answer: voter, vote type (+1/-1) and time, a column each
+
+    Past INDEX_AFTER votes, a user -> row dict is kept next to the columns
+    so finding a voter doesn't scan them all. Most answers have a handful
+    of votes and stay at 13 bytes a vote.
+    """
+
+    __slots__ = ("users", "types", "times", "_rows")
+
+    INDEX_AFTER = 32
+
+    def __init__(self):
+        self.users = array("i")
+        self.types = array("b")
+        self.times = array("q")
+        self._rows = None  # user -> row, once there are more than INDEX_AFTER votes
+
+    def find(self, user: int) -> int:
+        """Row of a user's vote, or -1"""
+        if self._rows is None:
+            if len(self.users) <= self.INDEX_AFTER:
+                try:
+                    return self.users.index(user)
+                except ValueError:
+                    return -1
+            self._rows = {voter: row for row, voter in enumerate(self.users)}
+        return self._rows.get(user, -1)
+
+    def append(self, user: int, vote_type: int, time: int):
+        if self._rows is not None:
+            self._rows[user] = len(self.users)
+        self.users.append(user)
+        self.types.append(vote_type)
+        self.times.append(time)
+
+    def delete(self, row: int):
+        # Move the last vote into the hole; order within an answer is not kept
+        if self._rows is not None:
+            del self._rows[self.users[row]]
+            if row < len(self.users) - 1:
+                self._rows[self.users[-1]] = row
+        for column in (self.users, self.types, self.times):
+            column[row] = column[-1]
+            column.pop()
+
+    def __len__(self):
+        return len(self.users)
+
+
+class VoteStore:
+    """Every vote, held column-wise per answer with UUIDs interned to ints
+
+    A vote takes 13 bytes (user index, signed vote type, int64 microsecond
+    timestamp) instead of a dict of strings. A vote is identified by its
+    answer and voter, which is also its key: ``answer << 32 | user``.
+    """
+
+    def __init__(self):
+        self.answers = Interner()
+        self.users = Interner()
+        self._votes = {}  # answer index -> AnswerVotes
+        self._count = 0
+
+    def key(self, answer_id: str, user_id: str):
+        """Key of a vote by its answer and voter, or None if there can't be one"""
+        answer = self.answers.lookup(answer_id)
+        user = self.users.lookup(user_id)
+        if answer is None or user is None:
+            return None
+        return answer << 32 | user
+
+    def get(self, key: int):
+        """(vote type, time) of a vote, or None"""
+        votes = self._votes.get(key >> 32)
+        row = votes.find(key & 0xFFFFFFFF) if votes is not None else -1
+        if row < 0:
+            return None
+        return votes.types[row], votes.times[row]
+
+    def put(self, answer_id: str, user_id: str, vote_type: int, time: int) -> int:
+        """Add or replace a vote; returns its key"""
+        answer = self.answers.intern(answer_id)
+        user = self.users.intern(user_id)
+        votes = self._votes.get(answer)
+        if votes is None:
+            votes = self._votes[answer] = AnswerVotes()
+
+        row = votes.find(user)
+        if row < 0:
+            votes.append(user, vote_type, time)
+            self._count += 1
+        else:
+            votes.types[row] = vote_type
+            votes.times[row] = time
+        return answer << 32 | user
+
+    def delete(self, key: int) -> bool:
+        answer = key >> 32
+        votes = self._votes.get(answer)
+        row = votes.find(key & 0xFFFFFFFF) if votes is not None else -1
+        if row < 0:
+            return False
+        votes.delete(row)
+        if not votes:
+            del self._votes[answer]
+        self._count -= 1
+        return True
+
+    def keys(self, answer_id: str = None):
+        """Keys of all votes, or of the votes on one answer"""
+        if answer_id is None:
+            answers = self._votes.items()
+        else:
+            answer = self.answers.lookup(answer_id)
+            answers = [(answer, self._votes[answer])] if answer in self._votes else []
+        return [answer << 32 | user for answer, votes in answers for user in votes.users]
+
+    def document(self, key: int) -> dict:
+        vote_type, time = self.get(key)
+        return {
+            "answer_id": self.answers[key >> 32],
+            "user_id": self.users[key & 0xFFFFFFFF],
+            "vote_type": VOTE_NAMES[vote_type],
+            "created_at": from_micros(time)
+        }
+
+    def documents(self):
+        return (self.document(key) for key in self.keys())
+
+    def __len__(self):
+        return self._count
+
+    # File layout: FILE_MAGIC, a 4-byte little-endian header length, a JSON
+    # header (answer and user id strings, votes per answer, byte order), then
+    # the user, type and time columns of every answer, in header order.
+
+    def dump(self) -> bytes:
+        answers = list(self._votes.items())
+        header = json.dumps({
+            "byteorder": sys.byteorder,
+            "answers": [self.answers[answer] for answer, _ in answers],
+            "counts": [len(votes) for _, votes in answers],
+            "users": self.users.strings
+        }).encode()
+        parts = [FILE_MAGIC, struct.pack("<I", len(header)), header]
+        for column in ("users", "types", "times"):
+            parts.extend(getattr(votes, column).tobytes() for _, votes in answers)
+        return b"".join(parts)
+
+    @classmethod
+    def load(cls, content: bytes):
+        if not content.startswith(FILE_MAGIC):
+            raise ValueError("Not a vote store file")
+        offset = len(FILE_MAGIC)
+        (header_size,) = struct.unpack_from("<I", content, offset)
+        offset += 4
+        header = json.loads(content[offset:offset + header_size])
+        offset += header_size
+
+        store = cls()
+        store.users = Interner(header["users"])
+        store.answers = Interner(header["answers"])
+        data = memoryview(content)
+        answer_votes = [AnswerVotes() for _ in header["answers"]]
+        for column in ("users", "types", "times"):
+            for votes, count in zip(answer_votes, header["counts"]):
+                values = getattr(votes, column)
+                size = count * values.itemsize
+                values.frombytes(data[offset:offset + size])
+                if header["byteorder"] != sys.byteorder:
+                    values.byteswap()
+                offset += size
+
+        store._votes = dict(enumerate(answer_votes))
+        store._count = sum(header["counts"])
+        return store
+
+    @classmethod
+    def read(cls, path: str):
+        with open(path, "rb") as f:
+            return cls.load(f.read())
+
+
+class VoteTable:
+    """The votes table as a VoteStore, saved to its own binary file
+
+    Exposes the subset of the TinyDB ``Table`` API the services use, like
+    SQLiteTable, so app/auth.py reads and writes votes the same way on
+    either backend. Doc ids are vote keys. Documents have no ``id``; a vote
+    is identified by ``answer_id`` and ``user_id``, and storing one for a
+    pair that already voted replaces that vote.
+
+    Reads hold the shared side of ``lock`` and writes the exclusive side.
+
+    With ``storage`` (the database's TransactionMiddleware) the table is
+    one of its companions: writes inside a transaction are undone if it
+    rolls back, and the database writes the vote file together with its
+    own file, whether write-through or write-behind. Without it, the file
+    is only written by flush().
+    """
+
+    name = "votes"
+
+    def __init__(self, path: str, lock, storage=None):
+        self.path = path
+        self._lock = lock
+        self._storage = storage
+        self._pending_writes = 0
+
+        self._store = VoteStore.read(path) if os.path.exists(path) else VoteStore()
+        if storage is not None:
+            storage.attach(self)
+
+    def __repr__(self):
+        return f"<VoteTable path={self.path!r}, total={len(self)}>"
+
+    def _keys(self, cond=None, doc_ids=None):
+        if doc_ids is not None:
+            return [doc_id for doc_id in doc_ids if self._store.get(doc_id) is not None]
+
+        equalities = query_equalities(cond) if cond is not None else {}
+        if "answer_id" in equalities and "user_id" in equalities:
+            key = self._store.key(equalities["answer_id"], equalities["user_id"])
+            keys = [key] if key is not None and self._store.get(key) is not None else []
+        else:
+            keys = self._store.keys(equalities.get("answer_id"))
+
+        if cond is None:
+            return keys
+        return [key for key in keys if cond(self._store.document(key))]
+
+    def _select(self, cond=None, doc_ids=None):
+        with self._lock.read():
+            return [Document(self._store.document(key), key) for key in self._keys(cond, doc_ids)]
+
+    def _put(self, document):
+        vote_type = VOTE_TYPES.get(document["vote_type"])
+        if vote_type is None:
+            raise ValueError(f"Unknown vote type: {document['vote_type']}")
+        self._record(document["answer_id"], document["user_id"])
+        return self._store.put(
+            document["answer_id"], document["user_id"], vote_type, to_micros(document["created_at"])
+        )
+
+    def _delete(self, key):
+        self._record(self._store.answers[key >> 32], self._store.users[key & 0xFFFFFFFF])
+        self._store.delete(key)
+
+    def _record(self, answer_id, user_id):
+        """Let an open transaction undo the coming change to this vote"""
+        undo = self._storage.undo if self._storage is not None else None
+        if undo is None:
+            return
+        key = self._store.key(answer_id, user_id)
+        previous = self._store.get(key) if key is not None else None
+        undo.append(lambda: self._restore(answer_id, user_id, previous))
+
+    def _restore(self, answer_id, user_id, previous):
+        if previous is not None:
+            self._store.put(answer_id, user_id, *previous)
+        else:
+            self._store.delete(self._store.key(answer_id, user_id))
+
+    def _written_changes(self, count):
+        self._pending_writes += count
+        if self._storage is not None:
+            self._storage.companion_changed(count)
+
+    def insert(self, document):
+        with self._lock:
+            key = self._put(document)
+            self._written_changes(1)
+        return key
+
+    def insert_multiple(self, documents):
+        with self._lock:
+            keys = [self._put(document) for document in documents]
+            self._written_changes(len(keys))
+        return keys
+
+    def all(self):
+        return self._select()
+
+    def search(self, cond):
+        return self._select(cond)
+
+    def get(self, cond=None, doc_id=None, doc_ids=None):
+        if doc_id is not None:
+            docs = self._select(doc_ids=[doc_id])
+            return docs[0] if docs else None
+        if doc_ids is not None:
+            return self._select(doc_ids=doc_ids)
+        if cond is not None:
+            docs = self._select(cond)
+            return docs[0] if docs else None
+        raise RuntimeError("You have to pass either cond or doc_id or doc_ids")
+
+    def contains(self, cond=None, doc_id=None):
+        return self.get(cond, doc_id=doc_id) is not None
+
+    def update(self, fields, cond=None, doc_ids=None):
+        with self._lock:
+            updated = []
+            for key in self._keys(cond, doc_ids):
+                document = self._store.document(key)
+                if callable(fields):
+                    fields(document)
+                else:
+                    document.update(fields)
+                new_key = self._store.key(document["answer_id"], document["user_id"])
+                if new_key != key:
+                    self._delete(key)
+                updated.append(self._put(document))
+            self._written_changes(len(updated))
+        return updated
+
+    def upsert(self, document, cond=None):
+        with self._lock:
+            updated = self.update(document, cond)
+            if updated:
+                return updated
+            return [self.insert(document)]
+
+    def remove(self, cond=None, doc_ids=None):
+        if cond is None and doc_ids is None:
+            raise RuntimeError("Use truncate() to remove all documents")
+
+        with self._lock:
+            removed = self._keys(cond, doc_ids)
+            for key in removed:
+                self._delete(key)
+            self._written_changes(len(removed))
+        return removed
+
+    def truncate(self):
+        with self._lock:
+            for key in self._keys():
+                self._delete(key)
+            self._written_changes(1)
+
+    def count(self, cond):
+        return len(self.search(cond))
+
+    def clear_cache(self):
+        pass
+
+    def __len__(self):
+        return len(self._store)
+
+    def __iter__(self):
+        return iter(self.all())
+
+    # Companion protocol: the database storage takes a snapshot under the
+    # writer lock and writes it before its own file
+
+    def snapshot(self):
+        """Serialized votes if they changed since the last snapshot, else None"""
+        with self._lock:
+            if not self._pending_writes:
+                return None
+            self._pending_writes = 0
+            return self._store.dump()
+
+    def write_snapshot(self, content: bytes):
+        write_file_atomic(self.path, content)
+
+    def flush(self):
+        """Write the votes to disk now if they changed"""
+        content = self.snapshot()
+        if content is not None:
+            self.write_snapshot(content)
@@ -0,0 +1,91 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.config import settings
+
+
+class WorkerPoolBusy(Exception):
+    """Raised when too many calls are already waiting for a worker pool"""
+
+
+class WorkerPool:
+    """Run blocking calls on a bounded thread pool and await their results
+
+    At most ``workers`` calls run at once; callers beyond that wait in the
+    pool's queue, and once ``max_queue`` are waiting new calls are refused
+    with WorkerPoolBusy instead of piling up. With ``workers=0`` calls run
+    inline on the caller's thread.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_queue_depth = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        if workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    async def run(self, func, *args, **kwargs):
+        if self._executor is None:
+            return func(*args, **kwargs)
+
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise WorkerPoolBusy(self.name)
+            self.queued += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queued)
+
+        # The queue slot is released once: by the worker that starts the
+        # call, or here if the caller gave up (was cancelled) before that
+        job = {"queued": True}
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(self._call, job, func, args, kwargs))
+        finally:
+            self._dequeue(job)
+
+    def _dequeue(self, job) -> bool:
+        """Release a job's queue slot; False if it was already released"""
+        with self._lock:
+            if not job["queued"]:
+                return False
+            job["queued"] = False
+            self.queued -= 1
+            return True
+
+    def _call(self, job, func, args, kwargs):
+        # Skip jobs whose caller is gone; their slot is already free
+        if not self._dequeue(job):
+            return None
+        with self._lock:
+            self.running += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "peak_queue_depth": self.peak_queue_depth
+            }
+
+
+# Blocking service functions (database access) run here, off the event loop
+service_pool = WorkerPool("services", settings.service_workers, settings.service_max_queue)
@@ -0,0 +1,184 @@
+"""CPU per response of the list endpoints, validated models vs stored rows
+
+For /get-questions, /questions/{id}/answers and /notifications, builds the
+response body for a page of ``--rows`` stored rows two ways:
+
+- models: one response model per row, then FastAPI validating and
+  serializing the result again through the route's response_model (how
+  these endpoints used to respond),
+- rows: the rows reduced to the model fields and dumped straight to JSON
+  bytes (app.serialization, orjson when installed).
+
+Only the response building is timed; fetching the rows is the same in both.
+
+Usage (from backend/):
+
+    python benchmarks/list_serialization.py [--rows 100] [--repeat 500] [--no-orjson]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DATA_DIR = tempfile.mkdtemp()
+os.environ.update(
+    DATABASE_PATH=os.path.join(DATA_DIR, "stackit.json"),
+    SQLITE_DATABASE_PATH=os.path.join(DATA_DIR, "stackit.db"),
+    AI_PROVIDER="fake",
+    AI_CACHE_PATH=""
+)
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from app import serialization
+from app.main import app
+from app.models import (
+    QuestionResponse, QuestionListResponse,
+    AnswerResponse, AnswerListResponse,
+    NotificationResponse, NotificationListResponse
+)
+
+
+def make_rows(count):
+    """Stored question, answer and notification rows as the services write them"""
+    start = datetime(2024, 1, 1)
+    questions, answers, notifications = [], [], []
+    for i in range(count):
+        created_at = (start + timedelta(minutes=i)).isoformat()
+        questions.append({
+            "id": str(uuid.uuid4()),
+            "title": f"How do I fix error {i} in my build?",
+            "description": "<p>The build fails with a long stack trace and I can't tell why.</p>" * 3,
+            "tags": ["python", f"tag{i % 50}"],
+            "author_id": str(uuid.uuid4()),
+            "author_username": "seed",
+            "created_at": created_at,
+            "updated_at": created_at,
+            "vote_count": i % 7,
+            "answer_count": i % 3,
+            "accepted_answer_id": None,
+            "view_count": i
+        })
+        answers.append({
+            "id": str(uuid.uuid4()),
+            "content": "<p>Delete the build directory and run a clean build.</p>" * 2,
+            "question_id": questions[0]["id"],
+            "author_id": str(uuid.uuid4()),
+            "author_username": "helper",
+            "created_at": created_at,
+            "updated_at": created_at,
+            "vote_count": i % 5,
+            "upvotes": i % 5,
+            "downvotes": 0,
+            "is_accepted": i == 0
+        })
+        notifications.append({
+            "id": str(uuid.uuid4()),
+            "user_id": questions[0]["author_id"],
+            "type": "new_answer",
+            "message": "helper answered your question",
+            "related_id": answers[-1]["id"],
+            "is_read": i % 2 == 0,
+            "created_at": created_at
+        })
+    return questions, answers, notifications
+
+
+def response_field(path):
+    for route in app.routes:
+        if getattr(route, "path", None) == path and "GET" in route.methods:
+            return route.response_field
+    raise LookupError(path)
+
+
+def endpoints(questions, answers, notifications):
+    """(path, build with models, build from rows) for each list endpoint"""
+    question_id = questions[0]["id"]
+
+    def questions_page():
+        return {"total": len(questions), "page": 1, "limit": len(questions), "next_cursor": None}
+
+    return [
+        (
+            "/get-questions",
+            lambda: QuestionListResponse(questions=[QuestionResponse(**q) for q in questions], **questions_page()),
+            lambda: {"questions": serialization.response_rows(QuestionResponse, questions), **questions_page()}
+        ),
+        (
+            "/questions/{question_id}/answers",
+            lambda: AnswerListResponse(
+                answers=[AnswerResponse(**a) for a in answers], total=len(answers), question_id=question_id
+            ),
+            lambda: {
+                "answers": serialization.response_rows(AnswerResponse, answers),
+                "total": len(answers),
+                "question_id": question_id
+            }
+        ),
+        (
+            "/notifications",
+            lambda: NotificationListResponse(
+                notifications=[NotificationResponse(**n) for n in notifications], unread_count=len(notifications) // 2
+            ),
+            lambda: {
+                "notifications": serialization.response_rows(NotificationResponse, notifications),
+                "unread_count": len(notifications) // 2
+            }
+        )
+    ]
+
+
+def cpu_per_call(function, repeat):
+    """Median process CPU time of one call, in microseconds"""
+    samples = []
+    for _ in range(5):
+        started = time.process_time()
+        for _ in range(repeat):
+            function()
+        samples.append((time.process_time() - started) / repeat)
+    return sorted(samples)[len(samples) // 2] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100, help="rows per response")
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--no-orjson", action="store_true", help="use the json module fallback")
+    args = parser.parse_args()
+
+    if args.no_orjson:
+        serialization.orjson = None
+
+    loop = asyncio.new_event_loop()
+    results = []
+    for path, build_models, build_rows in endpoints(*make_rows(args.rows)):
+        field = response_field(path)
+
+        def with_models():
+            # What FastAPI does with a returned model and a response_model
+            content = loop.run_until_complete(serialize_response(field=field, response_content=build_models()))
+            return JSONResponse(content).body
+
+        def from_rows():
+            return serialization.JSONBytesResponse(serialization.dump_json(build_rows())).body
+
+        models_us = cpu_per_call(with_models, args.repeat)
+        rows_us = cpu_per_call(from_rows, args.repeat)
+        results.append((path, models_us, rows_us))
+
+    encoder = "json" if serialization.orjson is None else "orjson"
+    print(f"rows={args.rows} encoder={encoder} (CPU us per response)")
+    print(f"{'endpoint':<36}{'models':>10}{'rows':>10}{'speedup':>10}")
+    for path, models_us, rows_us in results:
+        print(f"{path:<36}{models_us:>10.0f}{rows_us:>10.0f}{models_us / rows_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
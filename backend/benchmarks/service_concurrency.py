@@ -0,0 +1,184 @@
+"""Throughput and latency under concurrent load, services inline vs on the pool
+
+Starts the app under uvicorn against a seeded temporary database, once with
+SERVICE_WORKERS=0 (services run on the event loop, the old behaviour) and
+once with the service pool, and drives it from this process while:
+
+- writers post answers (every write rewrites the TinyDB file when
+  DATABASE_WRITE_BEHIND=false, the default for this benchmark),
+- readers fetch questions and question lists,
+- a probe hits /health every 10 ms to measure event loop stalls.
+
+Usage (from backend/):
+
+    python benchmarks/service_concurrency.py [--backend tinydb|sqlite]
+        [--questions 3000] [--seconds 5] [--readers 16] [--writers 4]
+        [--write-behind] [--port 8765]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import httpx
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(path, count):
+    """Write a TinyDB file with one user and ``count`` questions"""
+    start = datetime(2024, 1, 1)
+    user_id = str(uuid.uuid4())
+    questions = {}
+    for i in range(count):
+        created_at = (start + timedelta(minutes=i)).isoformat()
+        questions[str(i + 1)] = {
+            "id": str(uuid.uuid4()),
+            "title": f"How do I fix error {i} in my build?",
+            "description": "<p>The build fails with a long stack trace and I can't tell why.</p>" * 3,
+            "tags": ["python", f"tag{i % 50}"],
+            "author_id": user_id,
+            "author_username": "seed",
+            "created_at": created_at,
+            "updated_at": created_at,
+            "vote_count": 0,
+            "answer_count": 0,
+            "accepted_answer_id": None,
+            "view_count": 0
+        }
+    with open(path, "w") as f:
+        json.dump({"questions": questions}, f)
+    return [question["id"] for question in questions.values()]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def load(args, base_url, question_ids):
+    limits = httpx.Limits(max_connections=args.readers + args.writers + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await client.post("/auth/register", json={"username": "bench", "email": "bench@example.com", "password": "pw"})
+        response = await client.post("/auth/login", json={"email": "bench@example.com", "password": "pw"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        deadline = time.perf_counter() + args.seconds
+        reads, writes, probes = [], [], []
+
+        async def timed(results, request):
+            started = time.perf_counter()
+            response = await request
+            response.raise_for_status()
+            results.append(time.perf_counter() - started)
+
+        async def reader(n):
+            i = n
+            while time.perf_counter() < deadline:
+                i += 1
+                if i % 2:
+                    await timed(reads, client.get(f"/get-specific-questions/{question_ids[i % len(question_ids)]}"))
+                else:
+                    await timed(reads, client.get("/get-questions", params={"page": i % 20 + 1, "limit": 10}))
+
+        async def writer(n):
+            i = n
+            while time.perf_counter() < deadline:
+                i += 1
+                question_id = question_ids[(i * 7919) % len(question_ids)]
+                await timed(writes, client.post(
+                    f"/questions/{question_id}/answers", json={"content": "Try a clean build."}, headers=headers
+                ))
+
+        async def probe():
+            while time.perf_counter() < deadline:
+                await timed(probes, client.get("/health"))
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(
+            probe(),
+            *[reader(n) for n in range(args.readers)],
+            *[writer(n) for n in range(args.writers)]
+        )
+
+    return {
+        "reads_per_s": len(reads) / args.seconds,
+        "writes_per_s": len(writes) / args.seconds,
+        "read_p50_ms": statistics.median(reads) * 1000 if reads else 0.0,
+        "read_p99_ms": percentile(reads, 0.99) * 1000,
+        "write_p99_ms": percentile(writes, 0.99) * 1000,
+        "probe_p99_ms": percentile(probes, 0.99) * 1000,
+        "probe_max_ms": max(probes) * 1000 if probes else 0.0
+    }
+
+
+def wait_until_up(base_url, server):
+    for _ in range(300):
+        if server.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            httpx.get(f"{base_url}/health").raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def run_mode(args, service_workers):
+    with tempfile.TemporaryDirectory() as data_dir:
+        json_path = os.path.join(data_dir, "stackit.json")
+        question_ids = seed(json_path, args.questions)
+        env = dict(
+            os.environ,
+            DATABASE_BACKEND=args.backend,
+            DATABASE_PATH=json_path,
+            SQLITE_DATABASE_PATH=os.path.join(data_dir, "stackit.db"),
+            DATABASE_WRITE_BEHIND="true" if args.write_behind else "false",
+            SERVICE_WORKERS=str(service_workers),
+            BCRYPT_ROUNDS="4",
+            PYTHONPATH=BACKEND_DIR
+        )
+        command = [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--port", str(args.port), "--log-level", "warning", "--no-access-log"
+        ]
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen(command, env=env, cwd=BACKEND_DIR)
+        try:
+            wait_until_up(base_url, server)
+            return asyncio.run(load(args, base_url, question_ids))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", default="tinydb", choices=["tinydb", "sqlite"])
+    parser.add_argument("--questions", type=int, default=3000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=8, help="service pool size for the 'pool' run")
+    parser.add_argument("--write-behind", action="store_true", help="buffer TinyDB writes instead of writing through")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = {"inline": run_mode(args, 0), "pool": run_mode(args, args.workers)}
+    print(f"backend={args.backend} questions={args.questions} readers={args.readers} "
+          f"writers={args.writers} write_behind={args.write_behind}")
+    print(f"{'metric':<14}" + "".join(f"{mode:>12}" for mode in results))
+    for metric in results["inline"]:
+        print(f"{metric:<14}" + "".join(f"{result[metric]:>12.1f}" for result in results.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+from app.ai import answer_key
+
+
+def test_symbols_are_part_of_the_question():
+    keys = {answer_key(question, "model") for question in ("What is C++?", "What is C#?", "What is C?")}
+    assert len(keys) == 3
+
+
+def test_case_spacing_and_trailing_punctuation_are_ignored():
+    assert answer_key("What is  C++?", "model") == answer_key("what is c++", "model")
+    assert answer_key("What is Python?!", "model") == answer_key(" what is python. ", "model")
+
+
+def test_model_is_part_of_the_key():
+    assert answer_key("What is C?", "one") != answer_key("What is C?", "other")
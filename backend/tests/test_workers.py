@@ -0,0 +1,36 @@
+import asyncio
+import threading
+from app.workers import WorkerPool
+
+
+def test_cancelled_calls_release_their_queue_slot():
+    pool = WorkerPool("test", workers=1, max_queue=3)
+    release = threading.Event()
+    ran = []
+
+    async def scenario():
+        # Occupy the only worker so the next calls stay queued
+        blocker = asyncio.ensure_future(pool.run(release.wait))
+        while pool.stats()["running"] == 0:
+            await asyncio.sleep(0.01)
+
+        waiters = [asyncio.ensure_future(pool.run(ran.append, n)) for n in range(2)]
+        await asyncio.sleep(0.01)
+        assert pool.stats()["queued"] == 2
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        assert pool.stats()["queued"] == 0
+
+        release.set()
+        await blocker
+        assert await pool.run(lambda: "done") == "done"
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+    assert ran == []
+    assert pool.stats()["queued"] == 0
+    assert pool.stats()["running"] == 0
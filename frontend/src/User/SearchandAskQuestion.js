@@ -104,7 +104,67 @@ const handleAIResponse = async (question) => {
  
   useEffect(() => {
     fetchAllQuestions();
-    fetchNotifications();
+  }, []);
+
+  // Notifications are pushed over Server-Sent Events instead of polled.
+  // EventSource can't send the Authorization header, so each connection
+  // opens with a single-use ticket instead of the access token.
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!token) return;
+
+    let source = null;
+    let retry = null;
+    let closed = false;
+
+    const connect = async () => {
+      let ticket;
+      try {
+        const res = await axios.post(`${process.env.REACT_APP_API_URL}/notifications/stream-ticket`, null, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        ticket = res.data.ticket;
+      } catch (err) {
+        console.error('Failed to open notification stream', err);
+        return;
+      }
+      if (closed) return;
+
+      source = new EventSource(
+        `${process.env.REACT_APP_API_URL}/notifications/stream?ticket=${encodeURIComponent(ticket)}`
+      );
+      listen(source);
+      // A ticket works once, so reconnect with a new one
+      source.onerror = () => {
+        source.close();
+        retry = setTimeout(connect, 3000);
+      };
+    };
+
+    const listen = (source) => {
+      source.addEventListener('snapshot', (e) => {
+        setNotifications(JSON.parse(e.data).notifications || []);
+      });
+      source.addEventListener('notification', (e) => {
+        const notif = JSON.parse(e.data);
+        setNotifications(prev => [notif, ...prev.filter(n => n.id !== notif.id)]);
+      });
+      source.addEventListener('read', (e) => {
+        const { id } = JSON.parse(e.data);
+        setNotifications(prev => prev.map(n => (n.id === id ? { ...n, is_read: true } : n)));
+      });
+      source.addEventListener('read_all', () => {
+        setNotifications(prev => prev.map(n => ({ ...n, is_read: true })));
+      });
+      source.addEventListener('resync', fetchNotifications);
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      if (source) source.close();
+    };
   }, []);
 
   useEffect(() => {